@@ -1,19 +1,59 @@
 import os
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+import logging
+import math
+import time
+import uuid
+from contextlib import nullcontext
+from fastapi import FastAPI, Header, HTTPException
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_community.chat_message_histories import ChatMessageHistory
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 import re
+from collections import Counter
+from keyword_matcher import KeywordMatcher
+from concurrency import LLMGate, Overloaded, SingleFlight
+from response_cache import ResponseCache
+from near_duplicate import NearDuplicateIndex
+from session_store import SessionStore
+from session_backends import InMemorySessionBackend, SQLiteSessionBackend
+from tokens import estimate_tokens
+from domain_gate import DomainGate
+from rate_limit import TokenBucket, LLMRateLimiter, RetryPolicy
+from fake_llm import FakeChatModel
+from circuit_breaker import CircuitBreaker, CircuitOpen
+from hedging import HedgePolicy, LatencyWindow
+from model_router import ModelRouter, FAST
+from prompts import PROMPT_VARIANTS, build_prompt
+from metrics import Registry
+from usage import UsageTracker, usage_from_metadata
+from profiling import ProfileStore, ProfilingMiddleware, token_matches
 
 load_dotenv()
-api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
-    raise ValueError("❌ GOOGLE_API_KEY not found in .env")
-os.environ["GOOGLE_API_KEY"] = api_key
+
+# "gemini" (default) or "fake" for fully offline runs without an API key
+llm_provider = os.getenv("LLM_PROVIDER", "gemini").lower()
+if llm_provider == "gemini":
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("❌ GOOGLE_API_KEY not found in .env")
+    os.environ["GOOGLE_API_KEY"] = api_key
+elif llm_provider != "fake":
+    raise ValueError(f"❌ Unknown LLM_PROVIDER '{llm_provider}' (use 'gemini' or 'fake')")
+
+# Routing decisions (chatbot.router) and session flush errors (chatbot.sessions).
+# uvicorn only configures its own loggers, so these get a handler of their own.
+chatbot_logger = logging.getLogger("chatbot")
+if not chatbot_logger.handlers:
+    log_handler = logging.StreamHandler()
+    log_handler.setFormatter(logging.Formatter("%(levelname)s:     %(name)s: %(message)s"))
+    chatbot_logger.addHandler(log_handler)
+    chatbot_logger.propagate = False
+chatbot_logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
 
 sentiment_analyzer = SentimentIntensityAnalyzer()
 
@@ -32,11 +72,342 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.3)
+# Opt-in per-request profiling: with PROFILING_ENABLED=true, a /chat request
+# sent with the X-Profile header is sampled and its collapsed stacks are kept
+# in PROFILE_DIR. Without the flag the middleware isn't installed at all.
+profiling_enabled = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+profiling_token = os.getenv("PROFILING_TOKEN", "")
+profile_store = None
+if profiling_enabled and not profiling_token:
+    # Profiles expose stack frames and source paths, so they are never open to anyone
+    raise ValueError("❌ PROFILING_ENABLED=true needs a PROFILING_TOKEN")
+if profiling_enabled:
+    profile_store = ProfileStore(
+        os.getenv("PROFILE_DIR", "profiles"),
+        max_profiles=int(os.getenv("PROFILE_MAX_FILES", "20")),
+    )
+    app.add_middleware(
+        ProfilingMiddleware,
+        store=profile_store,
+        paths=[p.strip() for p in os.getenv("PROFILING_PATHS", "/chat").split(",") if p.strip()],
+        token=profiling_token,
+        interval=float(os.getenv("PROFILE_INTERVAL_MS", "1")) / 1000,
+    )
+
+def build_llm(model: str, max_output_tokens: int = None, thinking_budget: int = None):
+    if llm_provider == "fake":
+        return FakeChatModel(
+            model=model,
+            latency_ms=float(os.getenv("FAKE_LLM_LATENCY_MS", "200")),
+            latency_p99_ms=float(os.getenv("FAKE_LLM_LATENCY_P99_MS", "0")),
+            token_delay_ms=float(os.getenv("FAKE_LLM_TOKEN_DELAY_MS", "0")),
+            error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+            server_error_rate=float(os.getenv("FAKE_LLM_SERVER_ERROR_RATE", "0")),
+            seed=int(os.getenv("FAKE_LLM_SEED", "0")),
+            max_output_tokens=max_output_tokens,
+        )
+    # Retries are handled by llm_retry below, so the client makes a single attempt.
+    # Gemini 2.5 counts thinking tokens toward max_output_tokens, so the thinking
+    # budget is set explicitly (0 turns thinking off, -1 lets the model decide).
+    return ChatGoogleGenerativeAI(model=model, temperature=0.3, max_retries=1,
+                                  max_output_tokens=max_output_tokens, thinking_budget=thinking_budget)
+
+llm_model = "gemini-2.5-flash"
 
-user_memory = {}
+# Model used for hedged requests; a lighter model answers faster when the primary is slow
+llm_fallback_model = os.getenv("LLM_FALLBACK_MODEL", "") or llm_model
 
-def analyze_sentiment(text: str) -> dict:
+# Sends simple, low-risk turns to a faster model tier and complicated or emergency ones to the strong tier
+model_router = ModelRouter(
+    enabled=os.getenv("ROUTER_ENABLED", "false").lower() == "true",
+    max_fast_chars=int(os.getenv("ROUTER_MAX_FAST_CHARS", "280")),
+    max_fast_history_tokens=int(os.getenv("ROUTER_MAX_FAST_HISTORY_TOKENS", "400")),
+    strong_specialties=[s.strip() for s in os.getenv("ROUTER_STRONG_SPECIALTIES", "cardiac,psychiatry,pediatric").split(",") if s.strip()],
+)
+router_fast_model = os.getenv("ROUTER_FAST_MODEL", "gemini-2.5-flash-lite")
+
+# detail_mode profiles: answer token cap, thinking budget and length instructions for
+# the prompt. Each can be overridden with DETAIL_<MODE>_MAX_TOKENS,
+# DETAIL_<MODE>_THINKING_BUDGET and DETAIL_<MODE>_MODEL.
+DETAIL_PROFILE_DEFAULTS = {
+    "concise": (512, 0, "Keep it short: at most 5 bullet points or about 120 words."),
+    "standard": (1024, 0, "Cover what the user needs to know in a focused answer, using bullet points where they help."),
+    "detailed": (2048, 1024, "Give a thorough answer: likely causes, self-care steps, warning signs and when to see a doctor."),
+}
+
+def build_detail_profile(mode: str, max_output_tokens: int, thinking_budget: int, instructions: str) -> dict:
+    """
+    Builds the model clients for one detail_mode once, at startup.
+    The profile's model is the strong tier; the router's fast tier is only
+    built when routing is enabled. A fixed thinking budget is added on top
+    of the answer cap, so thinking can't eat into the answer.
+    """
+    prefix = f"DETAIL_{mode.upper()}_"
+    max_output_tokens = int(os.getenv(prefix + "MAX_TOKENS", str(max_output_tokens)))
+    thinking_budget = int(os.getenv(prefix + "THINKING_BUDGET", str(thinking_budget)))
+    model_cap = max_output_tokens + max(thinking_budget, 0)
+    model = os.getenv(prefix + "MODEL", "") or llm_model
+    strong_llm = build_llm(model, model_cap, thinking_budget)
+    fast_model = router_fast_model if model_router.enabled else model
+    return {
+        "mode": mode,
+        "model": model,
+        "fast_model": fast_model,
+        "max_output_tokens": max_output_tokens,
+        "thinking_budget": thinking_budget,
+        "response_instructions": f"RESPONSE LENGTH: {instructions}\n\nASSISTANT'S {mode.upper()} RESPONSE:",
+        "llm": strong_llm,
+        "fast_llm": build_llm(fast_model, model_cap, thinking_budget) if fast_model != model else strong_llm,
+        "fallback_llm": build_llm(llm_fallback_model, model_cap, thinking_budget),
+    }
+
+detail_profiles = {
+    mode: build_detail_profile(mode, max_output_tokens, thinking_budget, instructions)
+    for mode, (max_output_tokens, thinking_budget, instructions) in DETAIL_PROFILE_DEFAULTS.items()
+}
+# Used for requests without a (known) detail_mode
+default_detail_mode = os.getenv("DETAIL_MODE_DEFAULT", "concise")
+if default_detail_mode not in detail_profiles:
+    raise ValueError(f"❌ Unknown DETAIL_MODE_DEFAULT '{default_detail_mode}' (use {', '.join(detail_profiles)})")
+# Per-mode LLM latency and output size, reported in /stats
+detail_mode_stats = {
+    mode: {"requests": 0, "llm_calls": 0, "output_tokens": 0, "latency": LatencyWindow(1000)}
+    for mode in detail_profiles
+}
+
+# Fires a second request when the primary is slower than the recent p-th percentile
+llm_hedge = HedgePolicy(
+    enabled=os.getenv("LLM_HEDGE", "false").lower() == "true",
+    percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "95")),
+    min_delay=float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5")),
+    max_delay=float(os.getenv("LLM_HEDGE_MAX_DELAY", "10")),
+    initial_delay=float(os.getenv("LLM_HEDGE_INITIAL_DELAY", "3")),
+    max_ratio=float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1")),
+)
+
+# Client-side quota limits; set these to match the Gemini tier (0 disables a limit)
+llm_rate_limiter = LLMRateLimiter(
+    requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "1000")),
+    tokens_per_minute=float(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000")),
+)
+# Backoff with jitter for 429/5xx errors, bounded by a retry budget
+llm_retry = RetryPolicy(
+    max_attempts=int(os.getenv("LLM_MAX_ATTEMPTS", "3")),
+    base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5")),
+    max_delay=float(os.getenv("LLM_RETRY_MAX_DELAY", "8")),
+    budget_ratio=float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.1")),
+)
+
+# "full" sends the original prompt; "compact" moves condensed guidelines into the system instruction
+prompt_variant = os.getenv("PROMPT_VARIANT", "full").lower()
+if prompt_variant not in PROMPT_VARIANTS:
+    raise ValueError(f"❌ Unknown PROMPT_VARIANT '{prompt_variant}' (use {', '.join(PROMPT_VARIANTS)})")
+
+# Per-attempt timeout for a Gemini call, in seconds
+llm_timeout = float(os.getenv("LLM_TIMEOUT", "30"))
+
+# Stops calling Gemini while it is failing and answers in degraded mode instead
+llm_breaker = CircuitBreaker(
+    failure_rate=float(os.getenv("BREAKER_FAILURE_RATE", "0.5")),
+    min_calls=int(os.getenv("BREAKER_MIN_CALLS", "10")),
+    window_seconds=float(os.getenv("BREAKER_WINDOW_SECONDS", "30")),
+    open_seconds=float(os.getenv("BREAKER_OPEN_SECONDS", "30")),
+    half_open_probes=int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1")),
+)
+
+# Bounds concurrent Gemini calls; requests that can't get a slot in time get a 503.
+# Waiters are queued per priority class (highest first) and routine ones are shed first.
+llm_gate = LLMGate(
+    max_concurrent=int(os.getenv("LLM_MAX_CONCURRENCY", "32")),
+    max_waiting=int(os.getenv("LLM_MAX_QUEUE", "256")),
+    wait_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", "10")),
+    retry_after=float(os.getenv("LLM_RETRY_AFTER", "5")),
+    queue_limits={
+        "emergency": int(os.getenv("LLM_QUEUE_EMERGENCY", "256")),
+        "complicated": int(os.getenv("LLM_QUEUE_COMPLICATED", "256")),
+        "routine": int(os.getenv("LLM_QUEUE_ROUTINE", "192")),
+    },
+)
+
+# Identical prompts already in flight share one LLM call
+llm_flight = SingleFlight()
+
+# Exact-match cache of LLM replies keyed on the formatted prompt
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+)
+# Only history-free first turns are cached unless this is turned off
+cache_first_turn_only = os.getenv("RESPONSE_CACHE_FIRST_TURN_ONLY", "true").lower() == "true"
+
+# Paraphrase cache for first-turn questions (keyed by their normalized content words)
+near_duplicate_index = NearDuplicateIndex(
+    threshold=float(os.getenv("NEAR_DUP_THRESHOLD", "1.0")),
+    max_entries=int(os.getenv("NEAR_DUP_MAX_ENTRIES", "100000")),
+    ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+)
+
+# Where sessions live: "memory" (single worker) or "sqlite" (shared by all workers on the box)
+session_backend_name = os.getenv("SESSION_BACKEND", "memory").lower()
+if session_backend_name == "sqlite":
+    session_backend = SQLiteSessionBackend(os.getenv("SESSION_DB_PATH", "sessions.db"))
+elif session_backend_name == "memory":
+    session_backend = InMemorySessionBackend()
+else:
+    raise ValueError(f"❌ Unknown SESSION_BACKEND '{session_backend_name}' (use 'memory' or 'sqlite')")
+
+# Per-user conversation state, bounded by session count, idle time and history length
+session_store = SessionStore(
+    max_sessions=int(os.getenv("SESSION_MAX_COUNT", "10000")),
+    idle_ttl=float(os.getenv("SESSION_IDLE_TTL", "3600")),
+    history_size=int(os.getenv("SESSION_HISTORY_MESSAGES", "10")),
+    sentiment_size=int(os.getenv("SESSION_SENTIMENT_HISTORY", "50")),
+    token_budget=int(os.getenv("HISTORY_TOKEN_BUDGET", "1000")),
+    summary_budget=int(os.getenv("HISTORY_SUMMARY_TOKEN_BUDGET", "200")),
+    backend=session_backend,
+    read_cache_ttl=float(os.getenv("SESSION_CACHE_TTL", "1")),
+    flush_interval=float(os.getenv("SESSION_FLUSH_INTERVAL", "0.2")),
+    shards=int(os.getenv("SESSION_SHARDS", "16")),
+)
+
+# Local medical/non-medical classifier run before the LLM ("off", "shadow" or "enforce")
+domain_gate = DomainGate(
+    mode=os.getenv("DOMAIN_GATE_MODE", "shadow").lower(),
+    threshold=float(os.getenv("DOMAIN_GATE_THRESHOLD", "0.95")),
+)
+
+# Shared limits for /chat/batch, so bulk replays can't starve interactive traffic
+batch_max_items = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+batch_semaphore = asyncio.Semaphore(int(os.getenv("BATCH_MAX_CONCURRENCY", "8")))
+batch_bucket = TokenBucket(
+    rate=float(os.getenv("BATCH_RATE_PER_SECOND", "5")),
+    capacity=float(os.getenv("BATCH_BURST", "10")),
+)
+batch_stats = {"batches": 0, "items": 0, "errors": 0}
+
+# Emergency fast path: answer critical cases immediately with precomputed guidance.
+# EMERGENCY_FOLLOWUP=true also fetches the LLM's elaborated answer in the background
+# (streamed after the canned reply, or polled at /chat/followup/{id}). It is off by
+# default: it costs an LLM call per emergency turn, and the Node backend never polls.
+emergency_fast_path = os.getenv("EMERGENCY_FAST_PATH", "true").lower() == "true"
+emergency_followup = os.getenv("EMERGENCY_FOLLOWUP", "false").lower() == "true"
+followup_store = ResponseCache(max_entries=1000, ttl_seconds=600)
+background_tasks = set()
+
+# Running totals of estimated prompt tokens, with and without the history budget
+prompt_token_stats = {"turns": 0, "unbudgeted": 0, "budgeted": 0}
+
+# Token usage and cost per call, per model and for the heaviest users (set prices to your Gemini tier)
+usage_tracker = UsageTracker(
+    max_users=int(os.getenv("USAGE_MAX_USERS", "1000")),
+    input_price_per_million=float(os.getenv("LLM_PRICE_INPUT_PER_MILLION", "0.30")),
+    output_price_per_million=float(os.getenv("LLM_PRICE_OUTPUT_PER_MILLION", "2.50")),
+)
+
+# Prometheus metrics served at /metrics
+metrics_registry = Registry()
+stage_seconds = metrics_registry.histogram(
+    "chatbot_stage_seconds",
+    "Time spent in each stage of a chat turn (sentiment, triage, session, prompt, cache, llm, hospitals, commit, total)",
+    ("stage", "detail_mode", "specialty", "emotion"),
+)
+
+# Keyword categories used by the triage heuristics. All of them are compiled
+# into one matcher at import time, so each message is scanned exactly once.
+TRIAGE_KEYWORDS = {
+    # Emotions
+    "anger": ['angry', 'furious', 'mad', 'frustrated', 'annoyed', 'irritated', 'rage', 'outraged', 'pissed', 'upset'],
+    "pain": ['pain', 'pains', 'painful', 'hurt', 'hurts', 'hurting', 'ache', 'aches', 'aching', 'headache',
+             'stomachache', 'backache', 'toothache', 'suffering', 'agony'],
+    "anxiety": ['anxious', 'worried', 'scared', 'panic', 'panicking', 'panicked', 'panicky', 'nervous', 'fear', 'stress', 'stressed', 'terrified'],
+    "sad": ['sad', 'depressed', 'hopeless', 'lonely', 'crying', 'down', 'miserable', 'grief'],
+
+    # Serious symptoms that always need medical attention
+    "serious": [
+        'severe', 'intense', 'unbearable', 'chronic', 'persistent',
+        'blood', 'bleeding', 'unconscious', 'seizure', 'stroke',
+        'heart attack', 'chest pain', 'difficulty breathing', 'can\'t breathe',
+        'suicidal', 'suicide', 'kill myself', 'end my life',
+        'broken bone', 'fracture', 'accident', 'injury',
+        'high fever', 'very high temperature', 'fever for days',
+        'swelling', 'lump', 'growth', 'tumor',
+        'vision loss', 'blind', 'can\'t see', 'blurry vision',
+        'paralysis', 'can\'t move', 'numbness',
+        'vomiting blood', 'blood in stool', 'blood in urine',
+        'extreme pain', 'severe pain', 'excruciating',
+        'weeks', 'months', 'long time', 'getting worse',
+        'pregnant', 'pregnancy', 'miscarriage',
+        'allergic reaction', 'allergy', 'rash spreading',
+        'infection', 'pus', 'wound', 'cut deep'
+    ],
+    # Emergency keywords
+    "emergency": [
+        'emergency', 'urgent', 'critical', 'immediately', 'right now',
+        '911', '108', 'ambulance', 'help me', 'dying'
+    ],
+    # Life-threatening situations that get the emergency fast path. These replace the
+    # whole reply, so they are present-situation phrasings only, and a question that
+    # contains one ("what should I do if someone is choking?") still gets the first-aid
+    # answer (see detect_emergency). Plurals ("having chest pains") are covered by the
+    # matcher's inflection suffixes.
+    "critical": [
+        'i can\'t breathe', 'i cant breathe', 'i cannot breathe', 'i am not able to breathe',
+        'is not breathing', 'isn\'t breathing', 'stopped breathing',
+        'i have difficulty breathing', 'having difficulty breathing', 'having trouble breathing',
+        'i have chest pain', 'i have severe chest pain', 'having chest pain', 'my chest hurts',
+        'having a heart attack', 'having a stroke', 'having a seizure',
+        'is unconscious', 'won\'t wake up', 'i am choking', 'i\'m choking', 'is choking',
+        'i took an overdose', 'i overdosed', 'took too many pills',
+        'i am vomiting blood', 'i\'m vomiting blood', 'bleeding heavily', 'won\'t stop bleeding',
+        'i think i\'m dying', 'i think i am dying'
+    ],
+    "self_harm": [
+        'want to kill myself', 'going to kill myself', 'i will kill myself',
+        'want to end my life', 'going to end my life', 'want to die',
+        'i am suicidal', 'i\'m suicidal', 'i feel suicidal', 'feeling suicidal',
+        'thinking about suicide', 'thinking of suicide',
+        'want to hurt myself', 'going to hurt myself', 'i keep hurting myself', 'cutting myself'
+    ],
+    # Separators that indicate several symptoms in one message
+    "conjunction": ['and', ','],
+
+    # Location and facility requests
+    "bangalore": ['bangalore', 'bengaluru', 'blr', 'karnataka'],
+    "medical_facility": ['hospital', 'doctor', 'clinic', 'medical center', 'specialist', 'physician', 'surgeon'],
+
+    # Specialties
+    "specialty_cardiac": ['heart', 'cardiac', 'chest pain', 'heart attack', 'palpitation', 'palpitations'],
+    "specialty_pediatric": ['child', 'children', 'baby', 'pediatric', 'kid', 'kids', 'infant', 'toddler'],
+    "specialty_orthopedic": ['bone', 'bones', 'fracture', 'joint', 'joints', 'orthopedic', 'accident', 'injury', 'sprain'],
+    "specialty_emergency": ['emergency', 'urgent', 'immediate', 'immediately', '911', '108', 'critical', 'severe'],
+    "specialty_dermatology": ['skin', 'rash', 'acne', 'dermatology', 'itch', 'itchy', 'itching'],
+    "specialty_ophthalmology": ['eye', 'eyes', 'vision', 'ophthalmology', 'blind', 'see'],
+    "specialty_psychiatry": ['mental', 'depression', 'anxiety', 'psychiatry', 'therapy'],
+}
+
+# Order in which specialties are checked when a message matches several
+SPECIALTY_PRIORITY = [
+    "cardiac", "pediatric", "orthopedic", "emergency",
+    "dermatology", "ophthalmology", "psychiatry",
+]
+
+# "I don't want to die from cancer" is a question, not a crisis
+keyword_matcher = KeywordMatcher(TRIAGE_KEYWORDS, negatable=("self_harm",))
+
+# Keyword categories that mark a message as medical no matter what the domain gate says
+MEDICAL_SIGNAL_CATEGORIES = ("pain", "serious", "emergency", "critical", "self_harm", "medical_facility")
+
+# Typographic apostrophes (the mobile keyboard default) matched as plain ones
+APOSTROPHES = str.maketrans({"\u2019": "'", "\u2018": "'"})
+
+def match_keywords(text: str) -> Counter:
+    """
+    Runs every triage keyword category over the text in a single pass.
+    Returns a Counter of category -> number of hits.
+    """
+    return keyword_matcher.match(text.translate(APOSTROPHES))
+
+def analyze_sentiment(text: str, hits: Counter = None) -> dict:
     """
     Analyzes the sentiment and emotion of the user's input.
     Returns emotion type and sentiment scores.
@@ -47,29 +418,22 @@ def analyze_sentiment(text: str) -> dict:
     emotion = "neutral"
     motivation = ""
     
-    text_lower = text.lower()
-    
-    anger_keywords = ['angry', 'furious', 'mad', 'frustrated', 'annoyed', 'irritated', 'rage', 'outraged', 'pissed', 'upset']
-    
-    pain_keywords = ['pain', 'hurt', 'ache', 'suffering', 'agony']
-    
-    anxiety_keywords = ['anxious', 'worried', 'scared', 'panic', 'nervous', 'fear', 'stress', 'terrified']
-    
-    sad_keywords = ['sad', 'depressed', 'hopeless', 'lonely', 'crying', 'down', 'miserable', 'grief']
+    if hits is None:
+        hits = match_keywords(text)
     
-    if any(word in text_lower for word in anger_keywords):
+    if hits["anger"]:
         emotion = "frustrated"
         motivation = "I can see you're feeling frustrated. Your feelings are valid. Let's focus on finding solutions that can help you feel better. 🤝"
     
-    elif any(word in text_lower for word in pain_keywords):
+    elif hits["pain"]:
         emotion = "in pain"
         motivation = "I'm sorry you're experiencing pain. Your wellbeing matters, and I'm here to help you understand your symptoms better. �"
     
-    elif any(word in text_lower for word in anxiety_keywords):
+    elif hits["anxiety"]:
         emotion = "anxious"
         motivation = "I understand you're feeling worried. Take a deep breath - you're not alone in this. Let's work through this together, one step at a time. 🌟"
     
-    elif any(word in text_lower for word in sad_keywords) or compound < -0.5:
+    elif hits["sad"] or compound < -0.5:
         emotion = "sad"
         motivation = "I can sense you're going through a difficult time. Remember, it's okay to feel this way, and seeking help is a sign of strength. You're taking a positive step by reaching out. 💙"
     
@@ -134,81 +498,46 @@ bangalore_hospitals = {
     ]
 }
 
-def detect_complicated_case(text: str) -> bool:
+def detect_complicated_case(text: str, hits: Counter = None) -> bool:
     """
     Detects if the medical case is complicated and needs professional attention
     """
-    text_lower = text.lower()
-    
-    # Serious symptoms that always need medical attention
-    serious_keywords = [
-        'severe', 'intense', 'unbearable', 'chronic', 'persistent',
-        'blood', 'bleeding', 'unconscious', 'seizure', 'stroke',
-        'heart attack', 'chest pain', 'difficulty breathing', 'can\'t breathe',
-        'suicidal', 'suicide', 'kill myself', 'end my life',
-        'broken bone', 'fracture', 'accident', 'injury',
-        'high fever', 'very high temperature', 'fever for days',
-        'swelling', 'lump', 'growth', 'tumor',
-        'vision loss', 'blind', 'can\'t see', 'blurry vision',
-        'paralysis', 'can\'t move', 'numbness',
-        'vomiting blood', 'blood in stool', 'blood in urine',
-        'extreme pain', 'severe pain', 'excruciating',
-        'weeks', 'months', 'long time', 'getting worse',
-        'pregnant', 'pregnancy', 'miscarriage',
-        'allergic reaction', 'allergy', 'rash spreading',
-        'infection', 'pus', 'wound', 'cut deep'
-    ]
-    
-    # Emergency keywords
-    emergency_keywords = [
-        'emergency', 'urgent', 'critical', 'immediately', 'right now',
-        '911', '108', 'ambulance', 'help me', 'dying'
-    ]
+    if hits is None:
+        hits = match_keywords(text)
     
     # Check for serious or emergency keywords
-    has_serious = any(keyword in text_lower for keyword in serious_keywords)
-    has_emergency = any(keyword in text_lower for keyword in emergency_keywords)
+    has_serious = hits["serious"] > 0
+    has_emergency = hits["emergency"] > 0
     
     # Check for multiple symptoms (indicates complexity)
-    symptom_count = text_lower.count('and') + text_lower.count(',')
+    symptom_count = hits["conjunction"]
     multiple_symptoms = symptom_count >= 2
     
     return has_serious or has_emergency or multiple_symptoms
 
-def detect_location_and_specialty(text: str) -> dict:
+def detect_location_and_specialty(text: str, hits: Counter = None) -> dict:
     """
     Detects if user is asking for Bangalore hospitals and what specialty
     Also detects if case is complicated
     """
-    text_lower = text.lower()
+    if hits is None:
+        hits = match_keywords(text)
     
     # Check for Bangalore mentions
-    bangalore_keywords = ['bangalore', 'bengaluru', 'blr', 'karnataka']
-    is_bangalore = any(keyword in text_lower for keyword in bangalore_keywords)
+    is_bangalore = hits["bangalore"] > 0
     
     # Check for hospital/doctor request
-    medical_facility_keywords = ['hospital', 'doctor', 'clinic', 'medical center', 'specialist', 'physician', 'surgeon']
-    wants_facility = any(keyword in text_lower for keyword in medical_facility_keywords)
+    wants_facility = hits["medical_facility"] > 0
     
     # Check if case is complicated
-    is_complicated = detect_complicated_case(text)
+    is_complicated = detect_complicated_case(text, hits)
     
-    # Detect specialty
+    # Detect specialty (first matching specialty in priority order wins)
     specialty = "general"
-    if any(word in text_lower for word in ['heart', 'cardiac', 'chest pain', 'heart attack', 'palpitation']):
-        specialty = "cardiac"
-    elif any(word in text_lower for word in ['child', 'baby', 'pediatric', 'kid', 'infant', 'toddler']):
-        specialty = "pediatric"
-    elif any(word in text_lower for word in ['bone', 'fracture', 'joint', 'orthopedic', 'accident', 'injury', 'sprain']):
-        specialty = "orthopedic"
-    elif any(word in text_lower for word in ['emergency', 'urgent', 'immediate', '911', '108', 'critical', 'severe']):
-        specialty = "emergency"
-    elif any(word in text_lower for word in ['skin', 'rash', 'acne', 'dermatology', 'itch']):
-        specialty = "dermatology"
-    elif any(word in text_lower for word in ['eye', 'vision', 'ophthalmology', 'blind', 'see']):
-        specialty = "ophthalmology"
-    elif any(word in text_lower for word in ['mental', 'depression', 'anxiety', 'psychiatry', 'therapy']):
-        specialty = "psychiatry"
+    for name in SPECIALTY_PRIORITY:
+        if hits["specialty_" + name]:
+            specialty = name
+            break
     
     return {
         "is_bangalore": is_bangalore,
@@ -217,6 +546,39 @@ def detect_location_and_specialty(text: str) -> dict:
         "is_complicated": is_complicated
     }
 
+# Questions start with one of these words or end with "?"
+QUESTION_START = re.compile(
+    r"\s*(?:what|how|when|why|who|whom|which|where|is|are|was|should|can|could|would|will|do|does)\b",
+    re.IGNORECASE,
+)
+
+def is_question(text: str) -> bool:
+    return text.rstrip().endswith("?") or QUESTION_START.match(text) is not None
+
+def detect_emergency(text: str, hits: Counter = None) -> str:
+    """
+    Detects cases that get the emergency fast path.
+    Returns "self_harm", "medical" or None. Questions about a medical
+    emergency ("what should I do if someone is choking?") return None:
+    they need the first-aid answer, see detect_emergency_question.
+    """
+    if hits is None:
+        hits = match_keywords(text)
+    if hits["self_harm"]:
+        return "self_harm"
+    if hits["critical"] and not is_question(text):
+        return "medical"
+    return None
+
+def detect_emergency_question(text: str, hits: Counter = None) -> bool:
+    """
+    Detects questions about a medical emergency. They get a normal LLM
+    answer at emergency priority, with EMERGENCY_QUESTION_NOTE in front.
+    """
+    if hits is None:
+        hits = match_keywords(text)
+    return bool(hits["critical"]) and not hits["self_harm"] and is_question(text)
+
 def format_hospital_recommendations(specialty: str, is_complicated: bool = False) -> str:
     """
     Format hospital recommendations for Bangalore
@@ -246,145 +608,680 @@ def format_hospital_recommendations(specialty: str, is_complicated: bool = False
     
     return response
 
-medical_system_template = """
-You are a **Professional Medical Assistant AI** designed to provide helpful, accurate, and empathetic medical information.
-
-STRICT GUIDELINES:
-1. **ONLY answer medical and health-related questions** including:
-   - Symptoms analysis and possible conditions
-   - General health advice and wellness tips
-   - Medication information (general knowledge)
-   - Preventive care and healthy lifestyle
-   - Mental health support and guidance
-   - First aid recommendations
-   - When to seek emergency care
-   - **Hospital and doctor recommendations in Bangalore** (when asked)
-
-2. **If asked about NON-MEDICAL topics**, respond STRICTLY with:
-   "I apologize, but I can only assist with medical and health-related concerns. Please ask me about symptoms, health conditions, wellness, or medical advice."
-
-3. **NEVER hallucinate or make up information**:
-   - Only provide information based on established medical knowledge
-   - If uncertain, clearly state: "I'm not completely certain about this. Please consult a healthcare professional for accurate diagnosis."
-   - Always recommend consulting a doctor for serious symptoms or diagnosis
-
-4. **IMPORTANT DISCLAIMERS**:
-   - You are NOT a replacement for professional medical care
-   - For emergencies (chest pain, difficulty breathing, severe bleeding, etc.), ALWAYS advise: "This sounds like an emergency. Please call emergency services (108 in India) or visit the nearest emergency room immediately."
-   - For serious symptoms, ALWAYS recommend: "Please consult with a healthcare provider for proper examination and diagnosis."
-
-5. **Be Empathetic and Supportive**:
-   - Current user emotion: {emotion}
-   - Acknowledge their feelings appropriately
-   - Provide emotional support alongside medical information
-   - Use a caring, professional tone
-
-6. **Location-Specific Recommendations**:
-   - If user asks for Bangalore hospitals/doctors, hospital recommendations will be provided separately
-   - Focus your medical advice on the health concern itself
-   - Acknowledge the hospital list will follow your response
-
-7. **Response Format - BE RELEVANT AND FOCUSED**:
-   - Provide all RELEVANT information needed to answer the question
-   - Avoid unnecessary background information or explanations
-   - Skip lengthy introductions - get to the point quickly
-   - Don't explain basic concepts unless specifically asked
-   - Avoid repetitive statements or over-explaining
-   - Use bullet points when listing multiple items (symptoms, tips, etc.)
-   - Be clear and easy to understand
-   - Explain medical terms if used, but keep explanations brief
-   - Provide actionable advice when safe to do so
-   - Focus on what the user needs to know, not everything you could say
-
-EMOTIONAL CONTEXT:
-User's current emotional state: {emotion}
-Motivational message: {motivation}
-
-CONVERSATION HISTORY:
-{chat_history}
-
-USER'S MEDICAL CONCERN:
-{user_input}
-
-ASSISTANT'S CONCISE RESPONSE:
-"""
-
-def unified_chat(user_input: str, user_id: str = None, detail_mode: str = "concise"):
+# Fixed reply for non-medical topics (guideline 2 of the system template)
+NON_MEDICAL_REPLY = "I apologize, but I can only assist with medical and health-related concerns. Please ask me about symptoms, health conditions, wellness, or medical advice."
+
+# Precomputed replies for the emergency fast path, so critical information
+# never waits on the model
+EMERGENCY_GUIDANCE = {
+    "medical": (
+        "🚨 **This sounds like a medical emergency.**\n\n"
+        "   • **Call 108 (ambulance) or 112 right now**, or go to the nearest emergency room\n"
+        "   • Don't drive yourself - ask someone nearby to help you or stay with you\n"
+        "   • If someone is unresponsive and not breathing normally, start CPR if you know how\n"
+        "   • Unlock the door and keep your phone with you so responders can reach you\n"
+    ),
+    "self_harm": (
+        "🚨 **You don't have to face this alone - please reach out for help right now.**\n\n"
+        "   • **Call Tele-MANAS at 14416** (free, 24/7 mental health support in India)\n"
+        "   • If you are in immediate danger, **call 112 or 108** or go to the nearest emergency room\n"
+        "   • Stay with someone you trust and move away from anything you could use to hurt yourself\n"
+    ),
+}
+# Put in front of the LLM's answer to a question about an emergency
+EMERGENCY_QUESTION_NOTE = "🚨 **If this is happening right now, call 108 (ambulance) or 112 immediately.**\n"
+EMERGENCY_REPLIES = {
+    kind: guidance + "\n" + format_hospital_recommendations("emergency", True)
+    for kind, guidance in EMERGENCY_GUIDANCE.items()
+}
+
+def tier_model(profile: dict, tier: str):
+    """
+    (model name, client) for a routing tier of a detail_mode profile
+    """
+    if tier == FAST:
+        return profile["fast_model"], profile["fast_llm"]
+    return profile["model"], profile["llm"]
+
+async def call_llm(turn: dict) -> dict:
+    """
+    Sends a turn's prompt to Gemini without blocking the event loop.
+    Raises CircuitOpen right away while the breaker is open. Otherwise each
+    attempt waits for the RPM/TPM limiter and a slot in llm_gate for the
+    turn's priority class (raising Overloaded if none frees up); transient
+    429/5xx errors and timeouts are retried with jittered backoff outside
+    the gate. With hedging on, a slow attempt is raced against a second
+    call to the fallback model.
+    The turn's detail_mode profile and routing tier pick the model.
+    Batch calls additionally pass the shared batch concurrency and rate limits.
+    Returns {"response", "model", "hedged"}.
+    """
+    if not llm_breaker.allow_request():
+        raise CircuitOpen("Gemini is failing; answering in degraded mode")
+    llm_input = turn["llm_input"]
+    prompt_tokens = turn["prompt_tokens"]["budgeted"]
+    profile = turn["profile"]
+    model_name, primary_llm = tier_model(profile, turn["route"]["tier"])
+    
+    async def invoke(model):
+        await llm_rate_limiter.acquire(prompt_tokens)
+        async with llm_gate.slot(turn["priority"]):
+            return await asyncio.wait_for(model.ainvoke(llm_input), timeout=llm_timeout)
+    
+    async def attempt():
+        return await llm_hedge.run(lambda: invoke(primary_llm), lambda: invoke(profile["fallback_llm"]))
+    
     try:
-        sentiment_data = analyze_sentiment(user_input)
-        location_data = detect_location_and_specialty(user_input)
-        
-        if user_id not in user_memory:
-            user_memory[user_id] = {
-                "history": ChatMessageHistory(),
-                "sentiment_history": []
+        if turn["batch"]:
+            async with batch_semaphore:
+                await batch_bucket.acquire()
+                response, hedge = await llm_retry.run(attempt)
+        else:
+            response, hedge = await llm_retry.run(attempt)
+    except (Overloaded, asyncio.CancelledError):
+        llm_breaker.record_ignored()
+        raise
+    except Exception:
+        llm_breaker.record_failure()
+        raise
+    llm_breaker.record_success()
+    model_name = llm_fallback_model if hedge["winner"] == "hedge" else model_name
+    return {
+        "response": response,
+        "model": model_name,
+        "hedged": hedge["hedged"],
+        "usage": record_usage(turn, model_name, getattr(response, "usage_metadata", None), response.content),
+    }
+
+def record_usage(turn: dict, model_name: str, usage_metadata, text: str) -> dict:
+    """
+    Accounts one LLM call's tokens to the turn's user, falling back to
+    estimates when the provider didn't report usage. Returns the usage
+    with its cost.
+    """
+    usage = usage_from_metadata(usage_metadata)
+    estimated = usage is None
+    if estimated:
+        input_tokens = turn["prompt_tokens"]["budgeted"]
+        output_tokens = estimate_tokens(text)
+        usage = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                 "total_tokens": input_tokens + output_tokens, "reasoning_tokens": 0}
+    usage_tracker.record(turn["user_id"], model_name, usage, estimated)
+    return {**usage, "estimated": estimated, "cost_usd": usage_tracker.cost(usage)}
+
+def lap(timings: dict, stage: str, since: float) -> float:
+    """
+    Records the time elapsed since `since` as `stage`; returns the current time
+    """
+    now = time.perf_counter()
+    timings[stage] = now - since
+    return now
+
+async def prepare_turn(user_input: str, user_id: str = None, batch: bool = False,
+                 detail_mode: str = None, include_timings: bool = False, include_usage: bool = False) -> dict:
+    """
+    Runs the local analysis for one message and builds the LLM prompt.
+    Everything here finishes before the model is called.
+    Unknown detail modes fall back to DETAIL_MODE_DEFAULT.
+    """
+    started = time.perf_counter()
+    timings = {}
+    profile = detail_profiles.get(detail_mode) or detail_profiles[default_detail_mode]
+    detail_mode_stats[profile["mode"]]["requests"] += 1
+    hits = match_keywords(user_input)
+    sentiment_data = analyze_sentiment(user_input, hits)
+    now = lap(timings, "sentiment", started)
+    location_data = detect_location_and_specialty(user_input, hits)
+    medical_signal = any(hits[category] for category in MEDICAL_SIGNAL_CATEGORIES)
+    emergency = detect_emergency(user_input, hits)
+    emergency_question = detect_emergency_question(user_input, hits)
+    now = lap(timings, "triage", now)
+    
+    if user_id is None:
+        # Anonymous turns get a session of their own, so concurrent ones can't share history
+        session = session_store.new_session()
+    else:
+        session = await session_store.aget_or_create(user_id)
+    first_turn = session.is_empty()
+    # Follow-ups ("tell me more") only make sense with the history, so they're never rejected
+    gate_result = domain_gate.check(user_input, medical_signal, follow_up=not first_turn)
+    
+    session.add_sentiment({
+        "emotion": sentiment_data["emotion"],
+        "compound": sentiment_data["compound"]
+    })
+    session_store.mark_dirty(user_id, session)
+    
+    chat_history = session.render_history()
+    now = lap(timings, "session", now)
+
+    prompt = build_prompt(
+        prompt_variant,
+        chat_history=chat_history,
+        user_input=user_input,
+        emotion=sentiment_data["emotion"],
+        motivation=sentiment_data["motivation"],
+        response_instructions=profile["response_instructions"]
+    )
+    
+    # Prompt size with the budgeted history vs. the last messages sent verbatim
+    budgeted_tokens = prompt["tokens"]
+    unbudgeted_tokens = budgeted_tokens - session.history_tokens() + session.unbudgeted_history_tokens()
+    prompt_token_stats["turns"] += 1
+    prompt_token_stats["budgeted"] += budgeted_tokens
+    prompt_token_stats["unbudgeted"] += unbudgeted_tokens
+    
+    route = model_router.route(user_input, location_data, emergency or emergency_question,
+                               session.history_tokens())
+    
+    # Admission class for the LLM queue
+    if emergency or emergency_question:
+        priority = "emergency"
+    elif location_data["is_complicated"]:
+        priority = "complicated"
+    else:
+        priority = "routine"
+    lap(timings, "prompt", now)
+    
+    # Auto-suggest hospitals for complicated cases OR if explicitly asked for Bangalore facilities
+    should_recommend = (
+        location_data["is_complicated"] or  # Complicated case
+        (location_data["is_bangalore"] and location_data["wants_facility"])  # Explicit request
+    )
+    
+    return {
+        "user_input": user_input,
+        "user_id": user_id,
+        "sentiment": sentiment_data,
+        "location_context": location_data,
+        "session": session,
+        "formatted_prompt": prompt["text"],
+        "llm_input": prompt["llm_input"],
+        "first_turn": first_turn,
+        "prompt_tokens": {"unbudgeted": unbudgeted_tokens, "budgeted": budgeted_tokens},
+        "domain_gate": gate_result,
+        "emergency": emergency,
+        "emergency_question": emergency_question,
+        "batch": batch,
+        "profile": profile,
+        "route": route,
+        "priority": priority,
+        "should_recommend": should_recommend,
+        "started": started,
+        "timings": timings,
+        "include_timings": include_timings,
+        "include_usage": include_usage
+    }
+
+def hospital_block(turn: dict) -> str:
+    """
+    Returns the hospital recommendations for a turn, or "" if none apply
+    """
+    if not turn["should_recommend"]:
+        return ""
+    location_data = turn["location_context"]
+    return format_hospital_recommendations(
+        location_data["specialty"], 
+        location_data["is_complicated"]
+    )
+
+def commit_turn(turn: dict, final_response: str):
+    """
+    Stores the finished exchange in the user's conversation history
+    """
+    turn["session"].add_exchange(turn["user_input"], final_response)
+    session_store.mark_dirty(turn["user_id"], turn["session"])
+
+def error_reply(e: Exception) -> str:
+    """
+    User-facing message for a failed LLM call
+    """
+    if "quota" in str(e).lower() or "429" in str(e):
+        return "⚠️ Google Gemini API quota exceeded. Please check your API key or wait a minute."
+    return f"❌ Error: {str(e)}"
+
+def near_duplicate_namespace(turn: dict) -> str:
+    """
+    Paraphrases only share an answer within the same detail mode and emotion
+    """
+    return turn["profile"]["mode"] + ":" + turn["sentiment"]["emotion"]
+
+def record_llm_latency(turn: dict, seconds: float, text: str):
+    mode_stats = detail_mode_stats[turn["profile"]["mode"]]
+    mode_stats["llm_calls"] += 1
+    mode_stats["output_tokens"] += estimate_tokens(text)
+    mode_stats["latency"].add(seconds)
+
+def reply_cache_key(turn: dict):
+    """
+    Cache key for a turn's LLM reply, or None if the turn isn't cacheable
+    """
+    if not response_cache.enabled:
+        return None
+    if cache_first_turn_only and not turn["first_turn"]:
+        return None
+    return ResponseCache.fingerprint(turn["formatted_prompt"])
+
+def local_reply(turn: dict):
+    """
+    Answers a turn without the LLM when possible: non-medical queries the
+    domain gate is confident about, then exact and near-duplicate cache hits.
+    Returns {"text": ..., "cache": details or None}, or None.
+    """
+    gate_result = turn["domain_gate"]
+    if gate_result and gate_result["reject"]:
+        return {"text": NON_MEDICAL_REPLY, "cache": None}
+    
+    key = reply_cache_key(turn)
+    if key:
+        cached = response_cache.get(key)
+        if cached is not None:
+            return {"text": cached, "cache": {"type": "exact"}}
+    
+    # Paraphrases of earlier first-turn questions, answered in the same emotional tone
+    if turn["first_turn"] and near_duplicate_index.enabled:
+        match = near_duplicate_index.query(turn["user_input"], near_duplicate_namespace(turn))
+        if match:
+            return {
+                "text": match["answer"],
+                "cache": {
+                    "type": "near_duplicate",
+                    "score": match["score"],
+                    "matched_question": match["question"]
+                }
             }
+    return None
+
+def store_reply(turn: dict, text: str):
+    """
+    Remembers a fresh LLM reply so identical prompts can be served locally
+    """
+    gate_result = turn["domain_gate"]
+    # Enforce mode only ever rejects first turns, so only those are compared
+    if gate_result and domain_gate.mode == "shadow" and turn["first_turn"]:
+        domain_gate.record_llm_verdict(gate_result, "can only assist with medical" in text.lower())
+    
+    key = reply_cache_key(turn)
+    if key:
+        response_cache.put(key, text)
+    if turn["first_turn"]:
+        near_duplicate_index.add(turn["user_input"], text, near_duplicate_namespace(turn))
+
+# Shown instead of the model's answer while the circuit breaker is open
+DEGRADED_NOTICE = (
+    "⚠️ Our medical assistant is temporarily unavailable, so I can't give a detailed answer right now. "
+    "Please try again in a few minutes. If your symptoms are severe or getting worse, "
+    "please contact a doctor or call emergency services (108)."
+)
+
+def degraded_reply(turn: dict) -> dict:
+    """
+    Best local answer while the LLM is unavailable: a cached answer to the
+    same or a similar question if there is one, otherwise the motivational
+    message plus hospital recommendations.
+    """
+    cached = response_cache.get(ResponseCache.fingerprint(turn["formatted_prompt"]))
+    if cached is not None:
+        return {"text": cached, "cache": {"type": "exact"}, "degraded": True}
+    match = near_duplicate_index.query(turn["user_input"], near_duplicate_namespace(turn))
+    if match:
+        return {
+            "text": match["answer"],
+            "cache": {"type": "near_duplicate", "score": match["score"], "matched_question": match["question"]},
+            "degraded": True
+        }
+    
+    # Hospital recommendations are the most useful thing we can still compute locally
+    turn["should_recommend"] = True
+    return {
+        "text": turn["sentiment"]["motivation"] + "\n\n" + DEGRADED_NOTICE,
+        "cache": None,
+        "degraded": True
+    }
+
+async def generate_reply(turn: dict) -> dict:
+    """
+    Produces the LLM part of the reply, serving it from the cache when possible.
+    Concurrent turns with the same prompt share a single LLM call; each
+    caller still commits the reply to its own user's history.
+    Returns {"text": ..., "cache": None or details of the cache hit,
+    "llm": which model answered, whether a hedge fired and whether the call
+    was shared with another turn, when it was called; "usage": the call's
+    tokens and cost, None for turns that shared another turn's call}.
+    """
+    started = time.perf_counter()
+    cached = local_reply(turn)
+    if cached:
+        lap(turn["timings"], "cache", started)
+        return cached
+    
+    started = lap(turn["timings"], "cache", started)
+    leader = False
+    
+    async def call():
+        # Only runs for the turn whose call is shared; the others coalesce onto it
+        nonlocal leader
+        leader = True
+        return await call_llm(turn)
+    
+    try:
+        result = await llm_flight.do(ResponseCache.fingerprint(turn["formatted_prompt"]), call)
+    except CircuitOpen:
+        return degraded_reply(turn)
+    text = result["response"].content.strip()
+    llm_seconds = lap(turn["timings"], "llm", started) - started
+    if leader:
+        record_llm_latency(turn, llm_seconds, text)
+    store_reply(turn, text)
+    return {
+        "text": text,
+        "cache": None,
+        "llm": {"model": result["model"], "hedged": result["hedged"], "coalesced": not leader},
+        # The tokens were spent (and accounted) once, by the leader's call
+        "usage": result["usage"] if leader else None
+    }
+
+def start_emergency_followup(turn: dict):
+    """
+    Fetches the LLM's elaborated answer for an emergency turn in the background.
+    Returns the id to poll at /chat/followup/{id}, or None if follow-ups are off.
+    """
+    if not emergency_followup:
+        return None
+    followup_id = uuid.uuid4().hex
+    followup_store.put(followup_id, {"status": "pending"})
+    task = asyncio.create_task(elaborate_emergency(turn, followup_id))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return followup_id
+
+async def elaborate_emergency(turn: dict, followup_id: str):
+    try:
+        reply = await generate_reply(turn)
+        # Only served through /chat/followup: the history already holds the canned reply for
+        # this turn, and appending here could land after the user's next turn has committed.
+        followup_store.put(followup_id, {"status": "ready", "reply": reply["text"]})
+    except Overloaded as e:
+        followup_store.put(followup_id, {"status": "error", "reply": f"Service busy: {e}. Please retry shortly."})
+    except Exception as e:
+        followup_store.put(followup_id, {"status": "error", "reply": error_reply(e)})
+
+def finish_turn(turn: dict):
+    """
+    Records the turn's stage timings in the /metrics histograms.
+    Returns them in milliseconds if the request asked for them, else None.
+    """
+    timings = turn["timings"]
+    timings["total"] = time.perf_counter() - turn["started"]
+    labels = (turn["profile"]["mode"], turn["location_context"]["specialty"], turn["sentiment"]["emotion"])
+    for stage, seconds in timings.items():
+        stage_seconds.observe(seconds, (stage,) + labels)
+    if not turn["include_timings"]:
+        return None
+    return {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
+
+def with_timings(turn: dict, result: dict, usage: dict = None) -> dict:
+    """
+    Adds the optional per-request fields: timings_ms and token usage
+    (None when no LLM call was made for this reply).
+    """
+    timings = finish_turn(turn)
+    if timings is not None:
+        result["timings_ms"] = timings
+    if turn["include_usage"]:
+        result["usage"] = usage
+    return result
+
+def emergency_reply(turn: dict) -> dict:
+    """
+    Immediate answer for critical cases: precomputed guidance plus the
+    emergency hospital list, with the LLM's answer following separately.
+    """
+    final_response = EMERGENCY_REPLIES[turn["emergency"]]
+    started = time.perf_counter()
+    commit_turn(turn, final_response)
+    lap(turn["timings"], "commit", started)
+    return with_timings(turn, {
+        "reply": final_response,
+        "sentiment": turn["sentiment"],
+        "location_context": turn["location_context"],
+        "recommended_hospitals": True,
+        "cache": None,
+        "prompt_tokens": turn["prompt_tokens"],
+        "domain_gate": turn["domain_gate"],
+        "emergency": {"kind": turn["emergency"], "followup_id": start_emergency_followup(turn)},
+        "detail_mode": turn["profile"]["mode"]
+    })
+
+def user_turn_lock(user_id: str):
+    """
+    Serializes turns for one user so concurrent requests (e.g. two tabs)
+    can't interleave their history. Anonymous requests each have their own
+    throwaway session, so they aren't serialized.
+    """
+    if user_id is None:
+        return nullcontext()
+    return session_store.turn_lock(user_id)
+
+async def unified_chat(user_input: str, user_id: str = None, detail_mode: str = None, batch: bool = False,
+                       include_timings: bool = False, include_usage: bool = False):
+    async with user_turn_lock(user_id):
+        return await chat_turn(user_input, user_id, detail_mode, batch, include_timings, include_usage)
+
+async def chat_turn(user_input: str, user_id: str, detail_mode: str, batch: bool,
+                    include_timings: bool, include_usage: bool):
+    try:
+        turn = await prepare_turn(user_input, user_id, batch, detail_mode, include_timings, include_usage)
+        if turn["emergency"] and emergency_fast_path:
+            return emergency_reply(turn)
         
-        memory_data = user_memory[user_id]
-        memory = memory_data["history"]
-        
-        memory_data["sentiment_history"].append({
-            "emotion": sentiment_data["emotion"],
-            "compound": sentiment_data["compound"]
-        })
-        
-        chat_history = ""
-        for msg in memory.messages[-10:]:  
-            role = "User" if msg.type == "human" else "Assistant"
-            chat_history += f"{role}: {msg.content}\n"
-    
-        prompt = ChatPromptTemplate.from_template(medical_system_template)
-        formatted_prompt = prompt.format(
-            chat_history=chat_history, 
-            user_input=user_input,
-            emotion=sentiment_data["emotion"],
-            motivation=sentiment_data["motivation"]
-        )
-        
-        response = llm.invoke(formatted_prompt)
-        final_response = response.content.strip()
-        
-        # Auto-suggest hospitals for complicated cases OR if explicitly asked for Bangalore facilities
-        should_recommend = (
-            location_data["is_complicated"] or  # Complicated case
-            (location_data["is_bangalore"] and location_data["wants_facility"])  # Explicit request
-        )
+        reply = await generate_reply(turn)
+        final_response = reply["text"]
+        if turn["emergency_question"]:
+            final_response = EMERGENCY_QUESTION_NOTE + "\n" + final_response
         
-        if should_recommend:
-            hospital_list = format_hospital_recommendations(
-                location_data["specialty"], 
-                location_data["is_complicated"]
-            )
+        started = time.perf_counter()
+        hospital_list = hospital_block(turn)
+        if hospital_list:
             final_response += "\n\n" + hospital_list
+        started = lap(turn["timings"], "hospitals", started)
         
-        memory.add_user_message(user_input)
-        memory.add_ai_message(final_response)
+        commit_turn(turn, final_response)
+        lap(turn["timings"], "commit", started)
         
-        return {
+        return with_timings(turn, {
             "reply": final_response,
-            "sentiment": sentiment_data,
-            "location_context": location_data,
-            "recommended_hospitals": should_recommend
-        }
+            "sentiment": turn["sentiment"],
+            "location_context": turn["location_context"],
+            "recommended_hospitals": turn["should_recommend"],
+            "cache": reply["cache"],
+            "prompt_tokens": turn["prompt_tokens"],
+            "domain_gate": turn["domain_gate"],
+            "emergency": None,
+            "degraded": reply.get("degraded", False),
+            "llm": reply.get("llm"),
+            "detail_mode": turn["profile"]["mode"],
+            "routing": turn["route"],
+            "priority": turn["priority"]
+        }, reply.get("usage"))
 
+    except Overloaded:
+        raise
     except Exception as e:
-        if "quota" in str(e).lower() or "429" in str(e):
-            return {
-                "reply": "⚠️ Google Gemini API quota exceeded. Please check your API key or wait a minute.",
-                "sentiment": {"emotion": "neutral", "compound": 0}
-            }
+        if batch:
+            # run_batch reports it as this item's error
+            raise
         return {
-            "reply": f"❌ Error: {str(e)}",
+            "reply": error_reply(e),
             "sentiment": {"emotion": "neutral", "compound": 0}
         }
 
+def sse_event(event: str, data: dict) -> str:
+    """
+    Formats one Server-Sent Event
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_chat_events(turn: dict):
+    """
+    Yields one chat turn as Server-Sent Events:
+    context -> token* -> hospitals? -> done (or error).
+    Emergency turns send an "emergency" event with the precomputed guidance
+    right after the context, then (if enabled) stream the LLM's elaboration.
+    Questions about an emergency start with EMERGENCY_QUESTION_NOTE as a token.
+    History is committed only once the whole reply has been streamed.
+    """
+    yield sse_event("context", {
+        "sentiment": turn["sentiment"],
+        "location_context": turn["location_context"]
+    })
+    
+    emergency = turn["emergency"] if emergency_fast_path else None
+    if emergency:
+        emergency_text = EMERGENCY_REPLIES[emergency]
+        started = time.perf_counter()
+        commit_turn(turn, emergency_text)
+        lap(turn["timings"], "commit", started)
+        yield sse_event("emergency", {"kind": emergency, "text": emergency_text})
+        if not emergency_followup:
+            yield sse_event("done", with_timings(turn, {
+                "reply": emergency_text,
+                "recommended_hospitals": True,
+                "cache": None,
+                "prompt_tokens": turn["prompt_tokens"],
+                "domain_gate": turn["domain_gate"]
+            }))
+            return
+    
+    if turn["emergency_question"]:
+        yield sse_event("token", {"text": EMERGENCY_QUESTION_NOTE + "\n"})
+    
+    try:
+        started = time.perf_counter()
+        cached = local_reply(turn)
+        if not cached and not llm_breaker.allow_request():
+            cached = degraded_reply(turn)
+        lap(turn["timings"], "cache", started)
+        if cached:
+            yield sse_event("token", {"text": cached["text"]})
+            final_response = cached["text"]
+        else:
+            parts = []
+            usage_metadata = {}
+            stream_model, stream_llm = tier_model(turn["profile"], turn["route"]["tier"])
+            started = time.perf_counter()
+            try:
+                await llm_rate_limiter.acquire(turn["prompt_tokens"]["budgeted"])
+                async with llm_gate.slot(turn["priority"]):
+                    async for chunk in stream_llm.astream(turn["llm_input"]):
+                        # Chunks carry usage deltas; add them up
+                        for key, value in (getattr(chunk, "usage_metadata", None) or {}).items():
+                            if isinstance(value, int):
+                                usage_metadata[key] = usage_metadata.get(key, 0) + value
+                        if chunk.content:
+                            parts.append(chunk.content)
+                            yield sse_event("token", {"text": chunk.content})
+            except (Overloaded, asyncio.CancelledError, GeneratorExit):
+                llm_breaker.record_ignored()
+                raise
+            except Exception:
+                llm_breaker.record_failure()
+                raise
+            llm_breaker.record_success()
+            final_response = "".join(parts).strip()
+            record_llm_latency(turn, lap(turn["timings"], "llm", started) - started, final_response)
+            stream_usage = record_usage(turn, stream_model, usage_metadata, final_response)
+            store_reply(turn, final_response)
+        if turn["emergency_question"]:
+            final_response = EMERGENCY_QUESTION_NOTE + "\n" + final_response
+        
+        started = time.perf_counter()
+        if emergency:
+            # The hospital list already went out with the emergency event
+            turn["session"].add_ai_message(final_response)
+            session_store.mark_dirty(turn["user_id"], turn["session"])
+        else:
+            hospital_list = hospital_block(turn)
+            if hospital_list:
+                yield sse_event("hospitals", {"text": hospital_list})
+                final_response += "\n\n" + hospital_list
+            commit_turn(turn, final_response)
+        lap(turn["timings"], "commit", started)
+        
+        yield sse_event("done", with_timings(turn, {
+            "reply": final_response,
+            "recommended_hospitals": turn["should_recommend"],
+            "cache": cached["cache"] if cached else None,
+            "prompt_tokens": turn["prompt_tokens"],
+            "domain_gate": turn["domain_gate"],
+            "degraded": bool(cached and cached.get("degraded")),
+            # Streams always use the primary model; only /chat calls are hedged
+            "llm": None if cached else {"model": stream_model, "hedged": False},
+            "detail_mode": turn["profile"]["mode"],
+            "routing": turn["route"],
+            "priority": turn["priority"]
+        }, None if cached else stream_usage))
+    except Overloaded as e:
+        yield sse_event("error", {"reply": f"Service busy: {e}. Please retry shortly.", "retry_after": e.retry_after})
+    except Exception as e:
+        yield sse_event("error", {"reply": error_reply(e)})
+
 class ChatRequest(BaseModel):
     user_input: str
     user_id: str | None = None
-    detail_mode: str = "concise"
+    detail_mode: str | None = None
+    # Adds per-stage timings (milliseconds) to the response
+    include_timings: bool = False
+    # Adds the LLM call's token usage and cost to the response
+    include_usage: bool = False
+
+class BatchChatRequest(BaseModel):
+    items: list[ChatRequest]
+
+async def run_batch(items: list):
+    """
+    Runs a batch of chat requests concurrently and yields NDJSON lines in
+    completion order. Items sharing a user_id run one after another, in
+    request order, so each conversation's history stays consistent; items
+    without a user_id each get a fresh session that isn't stored, so they
+    run on their own and never see each other's messages.
+    """
+    groups = {}
+    for index, item in enumerate(items):
+        key = item.user_id if item.user_id is not None else ("anonymous", index)
+        groups.setdefault(key, []).append((index, item))
+    
+    results = asyncio.Queue()
+    
+    async def run_group(entries: list):
+        for index, item in entries:
+            if not item.user_input.strip():
+                result = {"error": "User input cannot be empty"}
+            else:
+                try:
+                    result = await unified_chat(item.user_input, item.user_id, item.detail_mode, batch=True,
+                                                include_timings=item.include_timings,
+                                                include_usage=item.include_usage)
+                except Overloaded as e:
+                    result = {"error": f"Service busy: {e}", "retry_after": e.retry_after}
+                except Exception as e:
+                    result = {"error": error_reply(e)}
+            if "error" in result:
+                batch_stats["errors"] += 1
+            batch_stats["items"] += 1
+            await results.put({"index": index, "user_id": item.user_id, **result})
+    
+    tasks = [asyncio.create_task(run_group(entries)) for entries in groups.values()]
+    try:
+        for _ in range(len(items)):
+            yield json.dumps(await results.get()) + "\n"
+    finally:
+        # Client went away: don't keep spending quota on the rest of the batch
+        for task in tasks:
+            task.cancel()
 
 @app.post("/chat")
-def chat(req: ChatRequest):
+async def chat(req: ChatRequest):
     """
     Medical Assistant Chatbot Endpoint
     Handles medical queries with sentiment analysis and emotional support.
@@ -393,9 +1290,76 @@ def chat(req: ChatRequest):
     if not req.user_input.strip():
         raise HTTPException(status_code=400, detail="User input cannot be empty")
 
-    result = unified_chat(req.user_input, req.user_id, req.detail_mode)
+    try:
+        result = await unified_chat(req.user_input, req.user_id, req.detail_mode,
+                                    include_timings=req.include_timings,
+                                    include_usage=req.include_usage)
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Service busy: {e}. Please retry shortly.",
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
     return result
 
+@app.post("/chat/batch")
+async def chat_batch(req: BatchChatRequest):
+    """
+    Batch variant of /chat for replay and QA jobs.
+    Streams one JSON object per line as items finish, each tagged with its
+    index in the request.
+    """
+    if not req.items:
+        raise HTTPException(status_code=400, detail="Batch must contain at least one item")
+    if len(req.items) > batch_max_items:
+        raise HTTPException(status_code=413, detail=f"Batch is limited to {batch_max_items} items")
+
+    batch_stats["batches"] += 1
+    return StreamingResponse(run_batch(req.items), media_type="application/x-ndjson")
+
+@app.get("/chat/followup/{followup_id}")
+def get_followup(followup_id: str):
+    """
+    Elaborated LLM answer for an emergency reply served by the fast path.
+    Status is "pending" until the answer is ready.
+    """
+    followup = followup_store.get(followup_id)
+    if followup is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired follow-up id")
+    return followup
+
+async def stream_chat(req: ChatRequest):
+    # The turn lock is taken inside the generator so it is always released
+    async with user_turn_lock(req.user_id):
+        turn = await prepare_turn(req.user_input, req.user_id, detail_mode=req.detail_mode,
+                            include_timings=req.include_timings,
+                            include_usage=req.include_usage)
+        async for event in stream_chat_events(turn):
+            yield event
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """
+    Streaming variant of /chat using Server-Sent Events.
+    Sends sentiment/location context first, then reply tokens as they are
+    generated, then the hospital recommendations, then a final "done" event.
+    """
+    if not req.user_input.strip():
+        raise HTTPException(status_code=400, detail="User input cannot be empty")
+
+    return StreamingResponse(
+        stream_chat(req),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.on_event("shutdown")
+def flush_sessions():
+    """
+    Writes any buffered session changes before the worker exits
+    """
+    session_store.close()
+
 @app.get("/")
 def root():
     return {
@@ -404,7 +1368,8 @@ def root():
             "Medical Q&A",
             "Sentiment Analysis",
             "Emotional Support",
-            "Context-aware responses"
+            "Context-aware responses",
+            "Streaming replies (SSE)"
         ]
     }
 
@@ -413,7 +1378,123 @@ def get_sentiment_history(user_id: str):
     """
     Get sentiment history for a specific user
     """
-    if user_id not in user_memory:
+    session = session_store.get(user_id)
+    if session is None:
         return {"sentiment_history": []}
     
-    return {"sentiment_history": user_memory[user_id]["sentiment_history"]}
+    with session.lock:
+        return {"sentiment_history": list(session.sentiment_history)}
+
+@app.get("/health/llm")
+def get_llm_health():
+    """
+    Circuit breaker state for the Gemini dependency
+    """
+    return llm_breaker.stats()
+
+def detail_mode_report() -> dict:
+    report = {}
+    for mode, profile in detail_profiles.items():
+        mode_stats = detail_mode_stats[mode]
+        calls = mode_stats["llm_calls"]
+        p50 = mode_stats["latency"].percentile(50)
+        p95 = mode_stats["latency"].percentile(95)
+        report[mode] = {
+            "model": profile["model"],
+            "fast_model": profile["fast_model"],
+            "max_output_tokens": profile["max_output_tokens"],
+            "thinking_budget": profile["thinking_budget"],
+            "requests": mode_stats["requests"],
+            "llm_calls": calls,
+            "avg_output_tokens": round(mode_stats["output_tokens"] / calls, 1) if calls else 0.0,
+            "llm_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "llm_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+        }
+    return report
+
+metrics_registry.gauge(
+    "chatbot_llm_in_flight", "LLM calls currently holding a slot", (),
+    lambda: {(): llm_gate.in_flight},
+)
+metrics_registry.gauge(
+    "chatbot_llm_queue_depth", "Requests waiting for an LLM slot, by priority class", ("priority",),
+    lambda: {(name,): c["waiting"] for name, c in llm_gate.stats()["classes"].items()},
+)
+metrics_registry.gauge(
+    "chatbot_llm_circuit_open", "1 while the LLM circuit breaker is open", (),
+    lambda: {(): int(llm_breaker.state == "open")},
+)
+metrics_registry.gauge(
+    "chatbot_sessions", "Sessions held in memory", (),
+    lambda: {(): len(session_store)},
+)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Prometheus text exposition of per-stage latency histograms and live gauges
+    """
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/usage")
+def get_usage(top: int = 20):
+    """
+    Token usage and cost: global and per-model totals plus the `top` heaviest users
+    """
+    return usage_tracker.stats(top=max(0, min(top, usage_tracker.max_users)))
+
+def check_profiling_access(x_profile: str):
+    """
+    Profiles expose stack frames and source paths, so reading them needs
+    the same X-Profile token as triggering them
+    """
+    if profile_store is None:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if not token_matches(profiling_token, x_profile):
+        raise HTTPException(status_code=403, detail="Missing or wrong X-Profile token")
+
+@app.get("/debug/profiles")
+def list_profiles(x_profile: str = Header(default=None)):
+    """
+    Stored request profiles, newest first
+    """
+    check_profiling_access(x_profile)
+    return {"profiles": profile_store.list(), "max_profiles": profile_store.max_profiles}
+
+@app.get("/debug/profiles/{profile_id}")
+def download_profile(profile_id: str, x_profile: str = Header(default=None)):
+    """
+    One request profile as collapsed stacks (flamegraph.pl, speedscope)
+    """
+    check_profiling_access(x_profile)
+    path = profile_store.path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.collapsed")
+
+@app.get("/stats")
+def get_stats():
+    """
+    Runtime statistics for capacity planning
+    """
+    return {
+        "llm_gate": llm_gate.stats(),
+        "response_cache": response_cache.stats(),
+        "near_duplicate_cache": near_duplicate_index.stats(),
+        "sessions": session_store.stats(),
+        "domain_gate": domain_gate.stats(),
+        "batch": {**batch_stats, "rate_limit": batch_bucket.stats()},
+        "llm_rate_limit": llm_rate_limiter.stats(),
+        "llm_retry": llm_retry.stats(),
+        "llm_coalescing": llm_flight.stats(),
+        "llm_breaker": llm_breaker.stats(),
+        "llm_hedging": llm_hedge.stats(),
+        "detail_modes": detail_mode_report(),
+        "model_router": model_router.stats(),
+        "usage": usage_tracker.stats(top=5),
+        "prompt_tokens": {
+            "variant": prompt_variant,
+            **prompt_token_stats,
+            "saved": prompt_token_stats["unbudgeted"] - prompt_token_stats["budgeted"]
+        }
+    }
@@ -0,0 +1,103 @@
+"""
+Detail Mode Benchmark
+Sends the same questions in every detail_mode to a running server and
+compares LLM latency, output and thinking tokens, cost and how many replies
+came back empty or cut off. Use it to check that concise really is faster
+and cheaper with the live model, and that its token cap isn't truncating
+answers. Every question gets a fresh user and a unique suffix, so caches
+and coalescing don't hide the model.
+
+Usage: python benchmark_detail_modes.py [--url http://localhost:8000] [--rounds 2]
+"""
+
+import argparse
+import statistics
+import time
+import uuid
+
+import requests
+
+QUESTIONS = [
+    "What are the symptoms of diabetes?",
+    "I have had a headache and mild fever since yesterday, what should I do?",
+    "How can I lower my blood pressure naturally?",
+    "My knee hurts when I climb stairs, is it arthritis?",
+    "What should I eat to recover faster from the flu?",
+    "Is it safe to take ibuprofen with paracetamol?",
+]
+MODES = ("concise", "standard", "detailed")
+
+
+def looks_truncated(reply: str) -> bool:
+    """Empty, or ending mid-sentence (the usual sign of hitting max_output_tokens)."""
+    text = reply.split("\n\n🏥", 1)[0].strip()
+    return not text or text[-1] not in ".!?)*💙"
+
+
+def run_mode(url: str, mode: str, rounds: int) -> dict:
+    latencies, output_tokens, reasoning_tokens, costs = [], [], [], []
+    truncated = errors = 0
+    for r in range(rounds):
+        for question in QUESTIONS:
+            response = requests.post(url.rstrip("/") + "/chat", json={
+                "user_input": f"{question} (run {uuid.uuid4().hex[:8]})",
+                "user_id": f"bench-{mode}-{uuid.uuid4().hex}",
+                "detail_mode": mode,
+                "include_timings": True,
+                "include_usage": True,
+            }, timeout=120)
+            body = response.json() if response.status_code == 200 else {}
+            usage = body.get("usage")
+            if not usage or body.get("degraded"):
+                errors += 1
+                continue
+            latencies.append(body["timings_ms"]["llm"])
+            output_tokens.append(usage["output_tokens"])
+            reasoning_tokens.append(usage.get("reasoning_tokens", 0))
+            costs.append(usage["cost_usd"])
+            truncated += looks_truncated(body["reply"])
+    latencies.sort()
+    return {
+        "mode": mode,
+        "calls": len(latencies),
+        "errors": errors,
+        "p50_ms": latencies[len(latencies) // 2] if latencies else 0.0,
+        "max_ms": latencies[-1] if latencies else 0.0,
+        "avg_output_tokens": statistics.fmean(output_tokens) if output_tokens else 0.0,
+        "avg_reasoning_tokens": statistics.fmean(reasoning_tokens) if reasoning_tokens else 0.0,
+        "avg_cost_usd": statistics.fmean(costs) if costs else 0.0,
+        "truncated": truncated,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--rounds", type=int, default=2, help="passes over the question set per mode")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("DETAIL MODE BENCHMARK".center(80))
+    print("=" * 80)
+    print(f"{len(QUESTIONS)} questions x {args.rounds} rounds per mode\n")
+    print(f"{'mode':<10}{'calls':>6}{'err':>5}{'p50 ms':>9}{'max ms':>9}"
+          f"{'out tok':>9}{'think tok':>11}{'cost $':>11}{'cut off':>9}")
+    print("-" * 79)
+
+    started = time.perf_counter()
+    results = [run_mode(args.url, mode, args.rounds) for mode in MODES]
+    for r in results:
+        print(f"{r['mode']:<10}{r['calls']:>6}{r['errors']:>5}{r['p50_ms']:>9.0f}{r['max_ms']:>9.0f}"
+              f"{r['avg_output_tokens']:>9.0f}{r['avg_reasoning_tokens']:>11.0f}"
+              f"{r['avg_cost_usd']:>11.6f}{r['truncated']:>9}")
+    print("-" * 79)
+
+    concise, _, detailed = results
+    if detailed["p50_ms"] and detailed["avg_cost_usd"]:
+        print(f"concise vs detailed: {concise['p50_ms'] / detailed['p50_ms']:.0%} of the latency, "
+              f"{concise['avg_cost_usd'] / detailed['avg_cost_usd']:.0%} of the cost per call")
+    print(f"Finished in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
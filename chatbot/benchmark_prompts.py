@@ -0,0 +1,122 @@
+"""
+Prompt Formatting Benchmark
+Compares the prompt variants on representative turns:
+
+- full, parsed per request (what every request used to do)
+- full, template compiled once at startup (PROMPT_VARIANT=full)
+- compact system instruction + dynamic turn message (PROMPT_VARIANT=compact)
+
+Reports formatting time per request and estimated prompt tokens per request.
+Runs offline, no server or API key needed.
+
+Usage: python benchmark_prompts.py [--iterations 2000]
+"""
+
+import argparse
+import statistics
+import time
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from prompts import build_prompt, medical_system_template
+from session_store import Session
+
+QUESTIONS = [
+    "What are the symptoms of diabetes?",
+    "I have had a headache and mild fever since yesterday, what should I do?",
+    "My child has a rash on his arms after playing outside, should I be worried?",
+    "Can you suggest a good cardiologist in Bangalore? I get chest discomfort when climbing stairs.",
+]
+
+EARLIER_TURNS = [
+    ("I have been feeling tired for a week.",
+     "Fatigue lasting a week can have many causes, such as poor sleep, stress, anemia or an infection. "
+     "- Keep a regular sleep schedule\n- Stay hydrated\n- See a doctor if it persists or worsens."),
+    ("I also feel dizzy in the mornings.",
+     "Morning dizziness can come from dehydration, low blood pressure or low blood sugar. "
+     "- Drink water after waking\n- Stand up slowly\n- Have a light breakfast."),
+    ("Could it be related to my blood pressure medicine?",
+     "Some blood pressure medicines can cause dizziness, especially after a dose change. "
+     "Please do not stop your medicine on your own; talk to your doctor about adjusting it."),
+]
+
+RESPONSE_INSTRUCTIONS = ("RESPONSE LENGTH: Keep it short: at most 5 bullet points or about 120 words.\n\n"
+                         "ASSISTANT'S CONCISE RESPONSE:")
+
+
+def sample_turns() -> list:
+    """Every question with an empty, a short and a longer history."""
+    turns = []
+    for history_turns in (0, 1, 3):
+        session = Session(history_size=10, sentiment_size=50)
+        for user_text, ai_text in EARLIER_TURNS[:history_turns]:
+            session.add_exchange(user_text, ai_text)
+        for question in QUESTIONS:
+            turns.append({
+                "chat_history": session.render_history(),
+                "user_input": question,
+                "emotion": "anxious",
+                "motivation": "I understand you're feeling worried. Let's work through this together. 💙",
+                "response_instructions": RESPONSE_INSTRUCTIONS,
+            })
+    return turns
+
+
+def parsed_per_request(**fields) -> dict:
+    prompt = ChatPromptTemplate.from_template(medical_system_template)
+    text = prompt.format(**fields)
+    return {"text": text, "tokens": build_prompt("full", **fields)["tokens"]}
+
+
+def benchmark(name: str, fn, turns: list, iterations: int) -> dict:
+    timings = []
+    tokens = []
+    for i in range(iterations):
+        fields = turns[i % len(turns)]
+        started = time.perf_counter()
+        prompt = fn(**fields)
+        timings.append((time.perf_counter() - started) * 1_000_000)
+        tokens.append(prompt["tokens"])
+    timings.sort()
+    return {
+        "name": name,
+        "avg_us": statistics.fmean(timings),
+        "p50_us": timings[len(timings) // 2],
+        "p99_us": timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+        "avg_tokens": statistics.fmean(tokens),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    turns = sample_turns()
+    variants = [
+        ("full, parsed per request", parsed_per_request),
+        ("full, compiled once", lambda **fields: build_prompt("full", **fields)),
+        ("compact", lambda **fields: build_prompt("compact", **fields)),
+    ]
+
+    print("=" * 80)
+    print("PROMPT FORMATTING BENCHMARK".center(80))
+    print("=" * 80)
+    print(f"{len(turns)} sample turns, {args.iterations} iterations per variant\n")
+    print(f"{'variant':<28}{'avg µs':>10}{'p50 µs':>10}{'p99 µs':>10}{'prompt tokens':>16}")
+    print("-" * 74)
+
+    results = [benchmark(name, fn, turns, args.iterations) for name, fn in variants]
+    for r in results:
+        print(f"{r['name']:<28}{r['avg_us']:>10.1f}{r['p50_us']:>10.1f}{r['p99_us']:>10.1f}{r['avg_tokens']:>16.1f}")
+
+    baseline, compiled, compact = results
+    print("-" * 74)
+    print(f"Compiling once saves {baseline['avg_us'] - compiled['avg_us']:.1f} µs per request "
+          f"({baseline['avg_us'] / compiled['avg_us']:.1f}x faster).")
+    print(f"The compact variant sends {compiled['avg_tokens'] - compact['avg_tokens']:.0f} fewer prompt tokens "
+          f"per request ({1 - compact['avg_tokens'] / compiled['avg_tokens']:.0%} less).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Domain Gate Check
+Run this before setting DOMAIN_GATE_MODE=enforce. Classifies held-out
+in-scope questions (wellness, diet, fitness, sleep and habits, medical
+history and trivia as well as symptoms) that must never be rejected, plus off-topic questions that
+should be. Fails if any in-scope question would be rejected at the
+threshold. The keyword bypass is not applied, so this is the worst case.
+Follow-ups inside a conversation ("tell me more") are checked too: the
+gate scores them out of context, so they must never be rejected there.
+Runs offline, no server or API key needed.
+
+Usage: python check_domain_gate.py [--threshold 0.95]
+"""
+
+import argparse
+import os
+
+from domain_gate import DomainGate, NON_MEDICAL
+
+# Must be answered. Keep these out of domain_gate_data.json so they stay held out.
+IN_SCOPE = [
+    "What's the best way to lose weight fast?",
+    "what's a good workout routine",
+    "What is the best way to get fit at home?",
+    "How often should I go to the gym?",
+    "Is cycling better than running for weight loss?",
+    "What should I eat to gain weight healthily?",
+    "Is a vegetarian diet healthy?",
+    "How many eggs a day is safe to eat?",
+    "What's the best way to sleep better at night?",
+    "How many hours should a teenager sleep?",
+    "How do I stop waking up at 3am?",
+    "What's the best way to stop biting my nails?",
+    "How can I cut down on junk food?",
+    "How do I stay active while working from home?",
+    "Tips to reduce stress at work",
+    "Is it healthy to skip breakfast?",
+    "How do I start meditating?",
+    "What are the benefits of walking every day?",
+    "What are the symptoms of dengue?",
+    "My throat hurts when I swallow",
+    "How do I take care of a newborn's umbilical cord?",
+    "Where can I find a dermatologist in Bangalore?",
+    "What is the history of vaccines?",
+    "Who discovered penicillin?",
+    "When was the first heart transplant done?",
+    "How many bones are in the human body?",
+]
+
+# Follow-ups after a medical first turn. Out of context many look non-medical,
+# so check() must never reject them once the conversation has history.
+FOLLOW_UPS = [
+    "Tell me more",
+    "Can you explain that again?",
+    "What do you mean?",
+    "Thanks, and what else?",
+    "Can you make it shorter?",
+    "Ok what about for kids?",
+]
+
+# Should be rejected; reported but not enforced, since a miss only costs an LLM call.
+OUT_OF_SCOPE = [
+    "What's the best way to learn Spanish?",
+    "What's a good morning routine for productivity?",
+    "How do I fix a leaking tap?",
+    "Who won the last Formula 1 race?",
+    "Write a haiku about autumn",
+    "What's the best way to clean a car interior?",
+    "How do I make a budget spreadsheet?",
+    "Recommend a TV series to binge watch",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("DOMAIN_GATE_THRESHOLD", "0.95")))
+    args = parser.parse_args()
+
+    gate = DomainGate(mode="enforce", threshold=args.threshold)
+
+    def rejected(text: str) -> tuple:
+        result = gate.classify(text)
+        p_non_medical = result["confidence"] if result["label"] == NON_MEDICAL else 1 - result["confidence"]
+        return p_non_medical >= args.threshold, p_non_medical
+
+    print("=" * 80)
+    print("DOMAIN GATE CHECK".center(80))
+    print("=" * 80)
+    print(f"threshold={args.threshold}\n")
+
+    wrongly_rejected = 0
+    print("In scope (must be answered):")
+    for text in IN_SCOPE:
+        reject, p = rejected(text)
+        wrongly_rejected += reject
+        print(f"  {'❌ REJECTED' if reject else '✅ allowed '}  P(non-medical)={p:.4f}  {text}")
+
+    print("\nFollow-ups in a conversation (must be answered):")
+    for text in FOLLOW_UPS:
+        _, p = rejected(text)
+        reject = gate.check(text, follow_up=True)["reject"]
+        wrongly_rejected += reject
+        print(f"  {'❌ REJECTED' if reject else '✅ allowed '}  P(non-medical)={p:.4f}  {text}")
+
+    caught = 0
+    print("\nOut of scope (should be rejected):")
+    for text in OUT_OF_SCOPE:
+        reject, p = rejected(text)
+        caught += reject
+        print(f"  {'✅ rejected' if reject else '⚠ allowed  '}  P(non-medical)={p:.4f}  {text}")
+
+    print(f"\nIn-scope rejected: {wrongly_rejected}/{len(IN_SCOPE) + len(FOLLOW_UPS)}   "
+          f"Out-of-scope rejected: {caught}/{len(OUT_OF_SCOPE)}")
+    if wrongly_rejected:
+        print("❌ Not safe to enforce: add similar in-scope examples to domain_gate_data.json")
+        raise SystemExit(1)
+    print("✅ Safe to enforce at this threshold")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+LLM Gate Check
+Releases a slot in the same event loop iteration in which a waiter's
+timeout fires, many times over, and checks that no slot is lost: the gate
+must end every trial with all its slots free and nobody waiting. Runs
+offline, no server or API key needed.
+
+Usage: python check_llm_gate.py [--trials 200]
+"""
+
+import argparse
+import asyncio
+import time
+
+from concurrency import LLMGate, Overloaded
+
+
+async def release_at_deadline(wait_timeout: float) -> str:
+    """One trial: the only slot is released right before the waiter times out."""
+    gate = LLMGate(max_concurrent=1, max_waiting=1, wait_timeout=wait_timeout, retry_after=1)
+    await gate.acquire()
+    loop = asyncio.get_running_loop()
+    # Scheduled before the waiter's timeout, so it runs first once both are due
+    loop.call_later(wait_timeout * 0.9, gate.release)
+    # Blocks the loop past the deadline, so the release and the timeout fire together
+    loop.call_later(wait_timeout * 0.5, time.sleep, wait_timeout)
+
+    try:
+        await gate.acquire()
+    except Overloaded:
+        outcome = "timed out"
+    else:
+        outcome = "admitted"
+        gate.release()
+
+    if gate._free != gate.max_concurrent or gate.in_flight or gate.waiting:
+        return f"leaked ({outcome}: free={gate._free} in_flight={gate.in_flight} waiting={gate.waiting})"
+    return outcome
+
+
+async def run(trials: int, wait_timeout: float) -> dict:
+    outcomes = {}
+    for _ in range(trials):
+        outcome = await release_at_deadline(wait_timeout)
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    return outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=200)
+    parser.add_argument("--wait-timeout", type=float, default=0.02)
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("LLM GATE CHECK".center(80))
+    print("=" * 80)
+
+    outcomes = asyncio.run(run(args.trials, args.wait_timeout))
+    for outcome, count in sorted(outcomes.items()):
+        print(f"  {count:>5}  {outcome}")
+
+    leaked = sum(count for outcome, count in outcomes.items() if outcome.startswith("leaked"))
+    print(f"\nTrials that leaked a slot: {leaked}/{args.trials}")
+    if leaked:
+        print("❌ A slot handed over at the timeout deadline is never returned")
+        raise SystemExit(1)
+    print("✅ No slot lost when a release races the timeout")
+
+
+if __name__ == "__main__":
+    main()
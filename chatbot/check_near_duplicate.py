@@ -0,0 +1,52 @@
+"""
+Near-Duplicate Check
+Stores one question of each pair in the paraphrase index and looks up the
+other. Paraphrases must reuse the stored answer; questions that differ in a
+question word, a modal, a conjunction, a drug or a number must not. Runs
+offline, no server or API key needed.
+
+Usage: python check_near_duplicate.py
+"""
+
+from near_duplicate import NearDuplicateIndex
+
+# (stored question, lookup, expected to match)
+PAIRS = [
+    ("What are the symptoms of flu?", "flu symptoms?", False),
+    ("flu symptoms?", "Symptoms of the flu", True),
+    ("How do I lower my blood pressure?", "How can I lower my blood pressure?", False),
+    ("How do I lower my blood pressure?", "how to lower blood pressure", True),
+    ("How do I lower my blood pressure?", "How do I lower blood pressure", True),
+    ("My tummy hurts after eating", "My stomach hurts after eating", True),
+    ("When should I take ibuprofen?", "Why should I take ibuprofen?", False),
+    ("Is it safe to take ibuprofen and paracetamol?", "Is it safe to take ibuprofen or paracetamol?", False),
+    ("Can I take aspirin while pregnant?", "Should I take aspirin while pregnant?", False),
+    ("Can I take ibuprofen for a headache?", "Can I take paracetamol for a headache?", False),
+    ("Is 500 mg of paracetamol safe?", "Is 1000 mg of paracetamol safe?", False),
+    ("Is a fever of 39 dangerous for a 12 kg child?", "Is a fever of 39 dangerous for a 20 kg child?", False),
+]
+
+
+def main():
+    print("=" * 80)
+    print("NEAR-DUPLICATE CHECK".center(80))
+    print("=" * 80)
+
+    wrong = 0
+    for stored, lookup, expected in PAIRS:
+        index = NearDuplicateIndex()
+        index.add(stored, "answer")
+        matched = index.query(lookup) is not None
+        wrong += matched != expected
+        verdict = "match" if matched else "no match"
+        print(f"{'✅' if matched == expected else '❌'} {verdict:>8}  {stored!r} vs {lookup!r}")
+
+    print(f"\nWrong decisions: {wrong}/{len(PAIRS)}")
+    if wrong:
+        print("❌ The paraphrase index reuses answers for different questions (or misses paraphrases)")
+        raise SystemExit(1)
+    print("✅ Paraphrases reuse the stored answer and different questions don't")
+
+
+if __name__ == "__main__":
+    main()
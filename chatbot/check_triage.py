@@ -0,0 +1,179 @@
+"""
+Triage Regression Check
+Compares the compiled keyword matcher against the substring scan it
+replaced, on messages that use inflected forms of the triage keywords
+(plurals, past tenses, "bloody", "stressful", ...). The old scan caught
+these implicitly, so the complicated flag, emotion and specialty must come
+out the same. Also checks which messages take the emergency fast path and
+which are questions about an emergency that get a normal answer, and that
+characters like "İ" and "ſ" are matched like "i" and "s".
+Fails on any difference. Runs offline with the fake LLM, no server or API
+key needed.
+
+Usage: python check_triage.py
+"""
+
+import os
+
+os.environ.setdefault("LLM_PROVIDER", "fake")
+
+from app import (  # noqa: E402
+    analyze_sentiment, detect_emergency, detect_emergency_question, detect_location_and_specialty,
+)
+
+# Inflected forms that the old substring scan matched
+INFLECTED = [
+    "I had seizures last night",
+    "I keep getting infections",
+    "My wounds are not healing",
+    "I found lumps under my arm",
+    "My fractured wrist is swollen",
+    "I noticed a bloody stool this morning",
+    "Are tumors always cancerous?",
+    "My father had two strokes",
+    "I get headaches every evening",
+    "I keep panicking before exams",
+    "My job is very stressful",
+    "I can't shake this sadness",
+    "My joints ache when it rains",
+    "I was bleeding from my gums",
+    "My kids have a fever",
+    "My eyes are itchy",
+]
+
+# Expected emergency fast path kind (None = normal LLM answer)
+EMERGENCIES = [
+    ("I want to die", "self_harm"),
+    ("I feel suicidal tonight", "self_harm"),
+    ("I don't want to die from cancer, what are the signs?", None),
+    ("I do not want to die young, how do I lower my cholesterol?", None),
+    ("I never want to hurt myself again, how do I manage my anger?", None),
+    ("What are the signs of a stroke?", None),
+    ("I can\u2019t breathe", "medical"),
+    ("I\u2019m choking", "medical"),
+    ("I am having chest pains", "medical"),
+    ("I have severe chest pains and my arm is numb", "medical"),
+    ("Help, my son is choking!", "medical"),
+    ("\u0130 can\u2019t breathe", "medical"),
+]
+
+# Characters that re.IGNORECASE folds differently from str.lower():
+# (message, complicated, emotion)
+CASE_FOLDED = [
+    ("I feel \u017fad", False, "sad"),
+    ("\u017feizure", True, None),
+    ("\u0130 am having a \u017feizure", True, None),
+]
+
+# Questions about an emergency: a normal first-aid answer with the "call 108" note in front
+EMERGENCY_QUESTIONS = [
+    "What are the symptoms of having a stroke?",
+    "Is choking on grapes common in toddlers?",
+    "What should I do if someone is choking?",
+    "How do I help someone who is having a seizure?",
+    "What is the first aid for someone who is not breathing?",
+]
+
+# The substring scan from before the compiled matcher, kept as the reference
+OLD_EMOTIONS = [
+    ("frustrated", ['angry', 'furious', 'mad', 'frustrated', 'annoyed', 'irritated', 'rage', 'outraged', 'pissed', 'upset']),
+    ("in pain", ['pain', 'hurt', 'ache', 'suffering', 'agony']),
+    ("anxious", ['anxious', 'worried', 'scared', 'panic', 'nervous', 'fear', 'stress', 'terrified']),
+    ("sad", ['sad', 'depressed', 'hopeless', 'lonely', 'crying', 'down', 'miserable', 'grief']),
+]
+OLD_SERIOUS = [
+    'severe', 'intense', 'unbearable', 'chronic', 'persistent',
+    'blood', 'bleeding', 'unconscious', 'seizure', 'stroke',
+    'heart attack', 'chest pain', 'difficulty breathing', 'can\'t breathe',
+    'suicidal', 'suicide', 'kill myself', 'end my life',
+    'broken bone', 'fracture', 'accident', 'injury',
+    'high fever', 'very high temperature', 'fever for days',
+    'swelling', 'lump', 'growth', 'tumor',
+    'vision loss', 'blind', 'can\'t see', 'blurry vision',
+    'paralysis', 'can\'t move', 'numbness',
+    'vomiting blood', 'blood in stool', 'blood in urine',
+    'extreme pain', 'severe pain', 'excruciating',
+    'weeks', 'months', 'long time', 'getting worse',
+    'pregnant', 'pregnancy', 'miscarriage',
+    'allergic reaction', 'allergy', 'rash spreading',
+    'infection', 'pus', 'wound', 'cut deep',
+    'emergency', 'urgent', 'critical', 'immediately', 'right now',
+    '911', '108', 'ambulance', 'help me', 'dying',
+]
+OLD_SPECIALTIES = [
+    ("cardiac", ['heart', 'cardiac', 'chest pain', 'heart attack', 'palpitation']),
+    ("pediatric", ['child', 'baby', 'pediatric', 'kid', 'infant', 'toddler']),
+    ("orthopedic", ['bone', 'fracture', 'joint', 'orthopedic', 'accident', 'injury', 'sprain']),
+    ("emergency", ['emergency', 'urgent', 'immediate', '911', '108', 'critical', 'severe']),
+    ("dermatology", ['skin', 'rash', 'acne', 'dermatology', 'itch']),
+    ("ophthalmology", ['eye', 'vision', 'ophthalmology', 'blind', 'see']),
+    ("psychiatry", ['mental', 'depression', 'anxiety', 'psychiatry', 'therapy']),
+]
+
+
+def old_triage(text: str, fallback_emotion: str) -> tuple:
+    text_lower = text.lower()
+    emotion = next((name for name, words in OLD_EMOTIONS if any(w in text_lower for w in words)), None)
+    if emotion is None:
+        # Past the keyword lists both versions fall back to the same sentiment score
+        emotion = fallback_emotion
+    complicated = (any(w in text_lower for w in OLD_SERIOUS)
+                   or text_lower.count('and') + text_lower.count(',') >= 2)
+    specialty = next((name for name, words in OLD_SPECIALTIES if any(w in text_lower for w in words)), "general")
+    return complicated, emotion, specialty
+
+
+def new_triage(text: str) -> tuple:
+    info = detect_location_and_specialty(text)
+    return info["is_complicated"], analyze_sentiment(text)["emotion"], info["specialty"]
+
+
+def main():
+    print("=" * 80)
+    print("TRIAGE REGRESSION CHECK".center(80))
+    print("=" * 80)
+    print(f"{'':3}{'complicated':>13}  {'emotion':>21}  {'specialty':>27}  message")
+
+    differences = 0
+    for text in INFLECTED:
+        new = new_triage(text)
+        old = old_triage(text, fallback_emotion=new[1])
+        same = old == new
+        differences += not same
+        cells = [f"{o!s:>6}/{n!s:<6}" if o != n else f"{n!s:>13}" for o, n in zip(old, new)]
+        print(f"{'✅' if same else '❌'} {cells[0]:>13}  {cells[1]:>21}  {cells[2]:>27}  {text}")
+
+    print(f"\nDifferences (old/new): {differences}/{len(INFLECTED)}")
+
+    print("\nCase folding:")
+    for text, complicated, emotion in CASE_FOLDED:
+        new = new_triage(text)
+        same = new[0] == complicated and emotion in (None, new[1])
+        differences += not same
+        print(f"{'✅' if same else '❌'} {new[0]!s:>13}  {new[1]:>21}  {new[2]:>27}  {text}")
+
+    print("\nEmergency fast path:")
+    wrong = 0
+    for text, expected in EMERGENCIES:
+        kind = detect_emergency(text)
+        wrong += kind != expected
+        print(f"{'✅' if kind == expected else '❌'} {str(kind):>10} (expected {str(expected):>9})  {text}")
+    for text in EMERGENCY_QUESTIONS:
+        kind = detect_emergency(text)
+        question = detect_emergency_question(text)
+        ok = kind is None and question
+        wrong += not ok
+        print(f"{'✅' if ok else '❌'} {str(kind):>10} (expected  question)  {text}")
+    print(f"\nWrong emergency decisions: {wrong}/{len(EMERGENCIES) + len(EMERGENCY_QUESTIONS)}")
+
+    if differences:
+        print("❌ The matcher misses inflected or case-folded forms")
+    if wrong:
+        print("❌ The emergency fast path misfires")
+    if differences or wrong:
+        raise SystemExit(1)
+    print("✅ Triage matches the substring scan on inflected forms and the fast path fires correctly")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Circuit breaker around the LLM call.
+When Gemini keeps failing, requests stop waiting on it and are answered in
+degraded mode right away; a few half-open probes detect recovery.
+"""
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling the LLM while the breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens when, over the last `window_seconds`, at least `min_calls` calls
+    were made and the failure rate reached `failure_rate`. After
+    `open_seconds` it lets up to `half_open_probes` calls through; one
+    success closes it again, one failure re-opens it.
+    """
+
+    def __init__(self, failure_rate: float = 0.5, min_calls: int = 10, window_seconds: float = 30,
+                 open_seconds: float = 30, half_open_probes: int = 1):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self._outcomes = deque()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self.times_opened = 0
+        self.short_circuited = 0
+
+    def _trim(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            _, failed = self._outcomes.popleft()
+            self._failures -= failed
+
+    def allow_request(self) -> bool:
+        now = time.monotonic()
+        if self.state == OPEN and now - self._opened_at >= self.open_seconds:
+            self.state = HALF_OPEN
+            self._probes = 0
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and self._probes < self.half_open_probes:
+            self._probes += 1
+            return True
+        self.short_circuited += 1
+        return False
+
+    def _open(self, now: float):
+        self.state = OPEN
+        self._opened_at = now
+        self.times_opened += 1
+
+    def record_success(self):
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            self.state = CLOSED
+            self._outcomes.clear()
+            self._failures = 0
+            return
+        self._outcomes.append((now, False))
+        self._trim(now)
+
+    def record_failure(self):
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            self._open(now)
+            return
+        self._outcomes.append((now, True))
+        self._failures += 1
+        self._trim(now)
+        calls = len(self._outcomes)
+        if self.state == CLOSED and calls >= self.min_calls and self._failures / calls >= self.failure_rate:
+            self._open(now)
+
+    def record_ignored(self):
+        """The call ended for a local reason (e.g. overload); frees a probe slot."""
+        if self.state == HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        self._trim(now)
+        calls = len(self._outcomes)
+        return {
+            "state": self.state,
+            "window_calls": calls,
+            "window_failure_rate": round(self._failures / calls, 4) if calls else 0.0,
+            "failure_rate_threshold": self.failure_rate,
+            "times_opened": self.times_opened,
+            "short_circuited": self.short_circuited,
+            "retry_in_seconds": round(max(0.0, self.open_seconds - (now - self._opened_at)), 1) if self.state == OPEN else 0.0,
+        }
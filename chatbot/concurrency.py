@@ -0,0 +1,206 @@
+"""
+Concurrency helpers for the chatbot service.
+Bounds how many LLM calls run at once and how many requests may wait for a
+slot, so overload turns into a fast 503 instead of an invisible queue, and
+urgent requests are served before routine ones.
+"""
+import asyncio
+import time
+from collections import deque
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot get an LLM slot in time."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMGate:
+    """
+    Async semaphore with bounded, prioritized wait queues.
+
+    At most `max_concurrent` callers hold a slot. Callers that have to wait
+    are queued by priority class; `queue_limits` maps each class to its
+    queue bound, highest priority first. A freed slot always goes to the
+    oldest waiter of the highest non-empty class, and nobody waits longer
+    than `wait_timeout` seconds.
+
+    A caller whose class queue is full is rejected right away. When
+    `max_waiting` callers are already waiting in total, the newest waiter
+    of a lower class is shed (it gets Overloaded) to make room, so routine
+    load is dropped before urgent load; with nobody lower to shed, the
+    caller itself is rejected.
+    """
+
+    def __init__(self, max_concurrent: int, max_waiting: int, wait_timeout: float, retry_after: float,
+                 queue_limits: dict = None):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.retry_after = retry_after
+        self.queue_limits = queue_limits or {"default": max_waiting}
+        self.classes = list(self.queue_limits)
+        self._free = max_concurrent
+        self._queues = {name: deque() for name in self.classes}
+        self.in_flight = 0
+        self.waiting = 0
+        self._class_stats = {
+            name: {"admitted": 0, "rejected_queue_full": 0, "rejected_timeout": 0, "shed": 0,
+                   "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+            for name in self.classes
+        }
+
+    def _shed_below(self, priority: str) -> bool:
+        """Fails the newest waiter of the lowest class below `priority`."""
+        for name in reversed(self.classes[self.classes.index(priority) + 1:]):
+            queue = self._queues[name]
+            while queue:
+                waiter = queue.pop()
+                self.waiting -= 1
+                if not waiter.done():
+                    self._class_stats[name]["shed"] += 1
+                    waiter.set_exception(Overloaded("Shed for higher-priority requests", self.retry_after))
+                    return True
+        return False
+
+    async def acquire(self, priority: str = None):
+        priority = priority or self.classes[-1]
+        stats = self._class_stats[priority]
+        started = time.perf_counter()
+        if self._free > 0 and not self.waiting:
+            # A free slot is taken without suspending, so the next caller
+            # already sees the updated count.
+            self._free -= 1
+        else:
+            queue = self._queues[priority]
+            if len(queue) >= self.queue_limits[priority] or (
+                self.waiting >= self.max_waiting and not self._shed_below(priority)
+            ):
+                stats["rejected_queue_full"] += 1
+                raise Overloaded("LLM wait queue is full", self.retry_after)
+            waiter = asyncio.get_running_loop().create_future()
+            queue.append(waiter)
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(waiter, timeout=self.wait_timeout)
+            except asyncio.TimeoutError:
+                if not (waiter.done() and not waiter.cancelled() and waiter.exception() is None):
+                    stats["rejected_timeout"] += 1
+                    raise Overloaded("Timed out waiting for an LLM slot", self.retry_after)
+                # The slot was handed over in the same loop iteration as the
+                # timeout fired; it is already ours, so take it.
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                    # The slot was handed over just as the caller went away
+                    self._free += 1
+                    self._wake()
+                raise
+            finally:
+                if waiter in queue:
+                    queue.remove(waiter)
+                    self.waiting -= 1
+
+        waited = time.perf_counter() - started
+        stats["wait_seconds"] += waited
+        stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+        stats["admitted"] += 1
+        self.in_flight += 1
+
+    def _wake(self):
+        """Hands free slots to the highest-priority waiters."""
+        for name in self.classes:
+            queue = self._queues[name]
+            while queue and self._free > 0:
+                waiter = queue.popleft()
+                self.waiting -= 1
+                if not waiter.done():
+                    self._free -= 1
+                    waiter.set_result(None)
+
+    def release(self):
+        self.in_flight -= 1
+        self._free += 1
+        self._wake()
+
+    def slot(self, priority: str = None):
+        """`async with gate.slot("emergency"):` holds a slot of that class."""
+        return _GateSlot(self, priority)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+    def stats(self) -> dict:
+        classes = {}
+        for name in self.classes:
+            stats = self._class_stats[name]
+            admitted = stats["admitted"]
+            classes[name] = {
+                "queue_limit": self.queue_limits[name],
+                "waiting": len(self._queues[name]),
+                "admitted": admitted,
+                "shed": stats["shed"],
+                "rejected_queue_full": stats["rejected_queue_full"],
+                "rejected_timeout": stats["rejected_timeout"],
+                "avg_wait_ms": round(stats["wait_seconds"] / admitted * 1000, 3) if admitted else 0.0,
+                "max_wait_ms": round(stats["max_wait_seconds"] * 1000, 3),
+            }
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_waiting": self.max_waiting,
+            "wait_timeout_seconds": self.wait_timeout,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": sum(c["admitted"] for c in classes.values()),
+            "classes": classes,
+        }
+
+
+class _GateSlot:
+    def __init__(self, gate: LLMGate, priority: str):
+        self.gate = gate
+        self.priority = priority
+
+    async def __aenter__(self):
+        await self.gate.acquire(self.priority)
+        return self.gate
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.gate.release()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: while a call for `key`
+    is in flight, later callers await the same result instead of starting
+    their own. The shared call runs as its own task, so one caller
+    disconnecting doesn't cancel it for the others.
+    """
+
+    def __init__(self):
+        self._in_flight = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn):
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+        }
@@ -0,0 +1,132 @@
+"""
+Local medical / non-medical classifier used before calling the LLM.
+A small multinomial Naive Bayes model over word unigrams and bigrams,
+trained at startup on the labeled examples in domain_gate_data.json.
+"""
+import json
+import math
+import os
+import re
+from collections import Counter
+
+_TOKEN = re.compile(r"[a-z0-9']+")
+
+DEFAULT_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "domain_gate_data.json")
+
+MEDICAL = "medical"
+NON_MEDICAL = "non_medical"
+
+
+def extract_features(text: str) -> list:
+    words = _TOKEN.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class DomainGate:
+    """
+    Classifies a query as medical or non-medical in a few microseconds.
+
+    `mode` is "off", "shadow" (classify and record agreement with the LLM,
+    but never block) or "enforce" (answer non-medical queries locally).
+    A query is only rejected when P(non_medical) >= `threshold`.
+    """
+
+    def __init__(self, mode: str = "shadow", threshold: float = 0.9, data_path: str = DEFAULT_DATA_PATH):
+        if mode not in ("off", "shadow", "enforce"):
+            raise ValueError(f"Unknown domain gate mode '{mode}' (use 'off', 'shadow' or 'enforce')")
+        self.mode = mode
+        self.threshold = threshold
+        self.classified = 0
+        self.rejected = 0
+        # Shadow-mode agreement between the local gate and the LLM's own refusal
+        self.agreement = Counter()
+        self._train(data_path)
+
+    def _train(self, data_path: str):
+        with open(data_path, encoding="utf-8") as f:
+            data = json.load(f)
+
+        self.labels = (MEDICAL, NON_MEDICAL)
+        counts = {label: Counter() for label in self.labels}
+        docs = {label: 0 for label in self.labels}
+        for label in self.labels:
+            for text in data[label]:
+                counts[label].update(extract_features(text))
+                docs[label] += 1
+
+        vocabulary = set()
+        for label in self.labels:
+            vocabulary.update(counts[label])
+        total_docs = sum(docs.values())
+
+        # Laplace-smoothed log probabilities
+        self._log_prior = {}
+        self._log_likelihood = {}
+        self._log_unseen = {}
+        for label in self.labels:
+            denominator = sum(counts[label].values()) + len(vocabulary)
+            self._log_prior[label] = math.log(docs[label] / total_docs)
+            self._log_likelihood[label] = {
+                feature: math.log((count + 1) / denominator)
+                for feature, count in counts[label].items()
+            }
+            self._log_unseen[label] = math.log(1 / denominator)
+        self.vocabulary = vocabulary
+
+    def classify(self, text: str) -> dict:
+        """Returns {"label", "confidence"} where confidence is P(label)."""
+        features = [f for f in extract_features(text) if f in self.vocabulary]
+        scores = {}
+        for label in self.labels:
+            likelihood = self._log_likelihood[label]
+            unseen = self._log_unseen[label]
+            scores[label] = self._log_prior[label] + sum(likelihood.get(f, unseen) for f in features)
+
+        # Normalize the two log scores into P(non_medical)
+        diff = scores[MEDICAL] - scores[NON_MEDICAL]
+        p_non_medical = 1 / (1 + math.exp(min(diff, 700)))
+        label = NON_MEDICAL if p_non_medical >= 0.5 else MEDICAL
+        confidence = p_non_medical if label == NON_MEDICAL else 1 - p_non_medical
+        return {"label": label, "confidence": round(confidence, 4)}
+
+    def check(self, text: str, medical_signal: bool = False, follow_up: bool = False):
+        """
+        Classifies a query and returns the result, or None when the gate is off.
+        `result["reject"]` is True only in enforce mode, above the threshold,
+        when the triage keywords found no medical signal and the query is not
+        a `follow_up` in an ongoing conversation (which is judged in context
+        by the LLM).
+        """
+        if self.mode == "off":
+            return None
+        result = self.classify(text)
+        self.classified += 1
+        result["reject"] = (
+            self.mode == "enforce"
+            and not follow_up
+            and not medical_signal
+            and result["label"] == NON_MEDICAL
+            and result["confidence"] >= self.threshold
+        )
+        if result["reject"]:
+            self.rejected += 1
+        return result
+
+    def record_llm_verdict(self, result: dict, llm_rejected: bool):
+        """Shadow mode: compares the local prediction with the LLM's answer."""
+        predicted = result["label"] == NON_MEDICAL and result["confidence"] >= self.threshold
+        key = ("gate_reject" if predicted else "gate_allow") + "/" + ("llm_reject" if llm_rejected else "llm_answer")
+        self.agreement[key] += 1
+
+    def stats(self) -> dict:
+        compared = sum(self.agreement.values())
+        agreed = self.agreement["gate_reject/llm_reject"] + self.agreement["gate_allow/llm_answer"]
+        return {
+            "mode": self.mode,
+            "threshold": self.threshold,
+            "classified": self.classified,
+            "rejected": self.rejected,
+            "shadow_compared": compared,
+            "shadow_agreement": round(agreed / compared, 4) if compared else None,
+            "shadow_matrix": dict(self.agreement),
+        }
@@ -0,0 +1,116 @@
+"""
+Deterministic stand-in for ChatGoogleGenerativeAI.
+Lets the service run fully offline (LLM_PROVIDER=fake) with a configurable
+latency distribution, injected 429 and 503 errors and token-by-token
+streaming, for load testing and exercising rate limiting and retries
+without spending quota.
+"""
+import asyncio
+import math
+import random
+
+from tokens import estimate_tokens
+
+
+class FakeRateLimitError(Exception):
+    """Mimics Gemini's quota error (HTTP 429 / RESOURCE_EXHAUSTED)."""
+
+    code = 429
+
+
+class FakeServerError(Exception):
+    """Mimics a transient Gemini server error (HTTP 503 / UNAVAILABLE)."""
+
+    code = 503
+
+
+class FakeMessage:
+    def __init__(self, content: str, usage_metadata: dict = None):
+        self.content = content
+        self.usage_metadata = usage_metadata
+
+
+class FakeChatModel:
+    """
+    Answers every prompt with a canned medical-style reply. The reply
+    depends only on the prompt, so repeated runs are reproducible; it is
+    cut to roughly `max_output_tokens`.
+
+    Time to first token is `latency_ms`, or lognormal with that median
+    when `latency_p99_ms` is higher, to model a long tail. Each generated
+    token then takes `token_delay_ms`. A call fails with
+    FakeRateLimitError with probability `error_rate` and with
+    FakeServerError with probability `server_error_rate`.
+    """
+
+    def __init__(self, model: str = "fake-llm", latency_ms: float = 200, error_rate: float = 0.0, seed: int = 0,
+                 max_output_tokens: int = None, latency_p99_ms: float = 0.0, token_delay_ms: float = 0.0,
+                 server_error_rate: float = 0.0):
+        self.model = model
+        self.latency_ms = latency_ms
+        self.latency_p99_ms = latency_p99_ms
+        self.token_delay_ms = token_delay_ms
+        self.error_rate = error_rate
+        self.server_error_rate = server_error_rate
+        self.max_output_tokens = max_output_tokens
+        self._rng = random.Random(seed)
+        self._sigma = 0.0
+        if latency_ms > 0 and latency_p99_ms > latency_ms:
+            # 2.326 is the z-score of the 99th percentile of a standard normal
+            self._sigma = math.log(latency_p99_ms / latency_ms) / 2.326
+
+    @staticmethod
+    def _prompt_text(prompt) -> str:
+        """Accepts a prompt string or a list of chat messages."""
+        if isinstance(prompt, str):
+            return prompt
+        return "\n".join(message.content for message in prompt)
+
+    def _reply_for(self, prompt) -> str:
+        prompt = self._prompt_text(prompt)
+        question = prompt.rsplit("USER'S MEDICAL CONCERN:", 1)[-1].strip().split("\n", 1)[0]
+        reply = (
+            f"Here is some general information about: {question}\n"
+            "- Rest, stay hydrated and monitor your symptoms.\n"
+            "- Please consult a healthcare professional for a proper diagnosis."
+        )
+        if self.max_output_tokens:
+            reply = reply[:self.max_output_tokens * 4]
+        return reply
+
+    def first_token_seconds(self) -> float:
+        if self._sigma:
+            return self._rng.lognormvariate(math.log(self.latency_ms), self._sigma) / 1000
+        return self.latency_ms / 1000
+
+    async def _wait_or_fail(self):
+        await asyncio.sleep(self.first_token_seconds())
+        roll = self._rng.random()
+        if roll < self.error_rate:
+            raise FakeRateLimitError("429 Resource has been exhausted (e.g. check quota).")
+        if roll < self.error_rate + self.server_error_rate:
+            raise FakeServerError("503 The model is overloaded. Please try again later.")
+
+    def _usage(self, prompt, content: str) -> dict:
+        input_tokens = estimate_tokens(self._prompt_text(prompt))
+        output_tokens = estimate_tokens(content)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    async def ainvoke(self, prompt, **kwargs) -> FakeMessage:
+        await self._wait_or_fail()
+        content = self._reply_for(prompt)
+        usage = self._usage(prompt, content)
+        if self.token_delay_ms:
+            await asyncio.sleep(usage["output_tokens"] * self.token_delay_ms / 1000)
+        return FakeMessage(content, usage)
+
+    async def astream(self, prompt, **kwargs):
+        await self._wait_or_fail()
+        content = self._reply_for(prompt)
+        for i, word in enumerate(content.split(" ")):
+            if i and self.token_delay_ms:
+                await asyncio.sleep(estimate_tokens(word) * self.token_delay_ms / 1000)
+            yield FakeMessage(word + " ")
+        # Like Gemini, usage arrives with the final chunk
+        yield FakeMessage("", self._usage(prompt, content))
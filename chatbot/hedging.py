@@ -0,0 +1,127 @@
+"""
+Hedged LLM requests for tail-latency control.
+If the primary call is slower than the recent p-th percentile, a second
+call is fired (optionally to a lighter fallback model) and whichever
+answers first wins; the other one is cancelled.
+"""
+import asyncio
+import time
+from collections import deque
+
+
+class LatencyWindow:
+    """Rolling window of the last `size` latencies, in seconds."""
+
+    def __init__(self, size: int = 500):
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p: float):
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * p / 100))
+        return ordered[index]
+
+
+class HedgePolicy:
+    """
+    Decides when to hedge and races the two calls.
+
+    The hedge delay is the `percentile` of recent primary latencies,
+    clamped to [`min_delay`, `max_delay`]; until `min_samples` latencies
+    have been seen `initial_delay` is used. At most `max_ratio` of calls
+    may hedge, so a slow patch can't double the load on the provider.
+    """
+
+    def __init__(self, enabled: bool = False, percentile: float = 95, min_delay: float = 0.5,
+                 max_delay: float = 10.0, initial_delay: float = 3.0, min_samples: int = 20,
+                 max_ratio: float = 0.1, window_size: int = 500):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self.latencies = LatencyWindow(window_size)
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.skipped_budget = 0
+
+    def delay(self) -> float:
+        if len(self.latencies) < self.min_samples:
+            return self.initial_delay
+        return min(self.max_delay, max(self.min_delay, self.latencies.percentile(self.percentile)))
+
+    def _may_hedge(self) -> bool:
+        if self.hedged + 1 > self.max_ratio * self.calls:
+            self.skipped_budget += 1
+            return False
+        return True
+
+    async def run(self, primary_fn, hedge_fn):
+        """
+        Awaits `primary_fn()`, hedging with `hedge_fn()` if it runs long.
+        Returns (result, {"hedged": bool, "winner": "primary" or "hedge"}).
+        If both calls fail, the primary's error is raised.
+        """
+        self.calls += 1
+        started = time.monotonic()
+        primary = asyncio.ensure_future(primary_fn())
+        if not self.enabled:
+            result = await primary
+            self.latencies.add(time.monotonic() - started)
+            return result, {"hedged": False, "winner": "primary"}
+
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.delay())
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        if done or not self._may_hedge():
+            result = await primary
+            self.latencies.add(time.monotonic() - started)
+            return result, {"hedged": False, "winner": "primary"}
+
+        self.hedged += 1
+        hedge = asyncio.ensure_future(hedge_fn())
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in (primary, hedge):
+                    if task in done and not task.cancelled() and task.exception() is None:
+                        winner = "primary" if task is primary else "hedge"
+                        if winner == "hedge":
+                            self.hedge_wins += 1
+                        return task.result(), {"hedged": True, "winner": winner}
+            return await primary
+        finally:
+            # The primary's latency is censored when the hedge wins, but it is
+            # still at least this long, which keeps the percentile honest.
+            self.latencies.add(time.monotonic() - started)
+            for task in (primary, hedge):
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # mark the loser's error as retrieved
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "percentile": self.percentile,
+            "current_delay_seconds": round(self.delay(), 3),
+            "samples": len(self.latencies),
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "skipped_budget": self.skipped_budget,
+            "hedge_rate": round(self.hedged / self.calls, 4) if self.calls else 0.0,
+        }
@@ -0,0 +1,132 @@
+"""
+Single-pass keyword matcher for the triage heuristics.
+Compiles every keyword list into one word-bounded regex so that a message
+is scanned once, no matter how many categories or keywords exist.
+"""
+import re
+from collections import Counter
+
+# Inflectional endings accepted after a keyword, so "seizure" also matches
+# "seizures", "fracture" matches "fractured" and "blood" matches "bloody".
+# Irregular forms ("panicking") still have to be listed as keywords.
+SUFFIXES = ("s", "es", "d", "ed", "ing", "y", "ful", "ness")
+
+# A negation right before a keyword, optionally with one word in between
+# ("don't want to die", "never really want to ...").
+NEGATION = re.compile(r"\b(?:not|never|don't|dont|doesn't|didn't)\s+(?:\w+\s+)?$")
+
+
+def fold(text: str) -> str:
+    """
+    Case-folds text for matching. "İ" folds to "i" plus a combining dot,
+    which is dropped so "İ can't breathe" reads like "i can't breathe".
+    """
+    return text.casefold().replace("\u0307", "")
+
+
+class KeywordMatcher:
+    """
+    Matches many keyword categories against a text in one linear pass.
+
+    `categories` maps a category name to a list of keywords/phrases.
+    `match(text)` returns a Counter of category -> number of hits.
+    Keywords ending in a letter also match with one of SUFFIXES appended.
+    Matches of the `negatable` categories are not counted when a negation
+    precedes them. Keywords and text are compared after `fold`, so "İ" and
+    "ſ" match like "i" and "s".
+    """
+
+    def __init__(self, categories: dict, negatable: tuple = ()):
+        self.categories = {name: list(words) for name, words in categories.items()}
+        self.negatable = frozenset(negatable)
+
+        phrase_categories = {}
+        for name, words in self.categories.items():
+            for word in words:
+                phrase_categories.setdefault(fold(word), set()).add(name)
+
+        # A regex reports a single alternative per start position, so a phrase
+        # like "severe pain" would hide "severe". Fold the categories of every
+        # keyword that is a whole-word prefix of a phrase into that phrase.
+        self._phrase_categories = {}
+        for phrase, names in phrase_categories.items():
+            implied = set(names)
+            for other, other_names in phrase_categories.items():
+                if other != phrase and self._is_word_prefix(other, phrase):
+                    implied |= other_names
+            self._phrase_categories[phrase] = tuple(sorted(implied))
+
+        # One trie-shaped alternation: shared prefixes are matched once, and at
+        # each node the longer continuations are tried before the shorter match.
+        # The zero-width lookahead lets matches overlap at different start
+        # positions ("chest pain" and "pain" are both reported) in one scan.
+        trie = {}
+        for phrase in self._phrase_categories:
+            node = trie
+            for char in phrase:
+                node = node.setdefault(char, {})
+            node[""] = phrase
+        # Case-sensitive on purpose: re.IGNORECASE also matches characters
+        # whose .lower() is not a keyword ("ſ" for "s", "İ" for "i"), so the
+        # text is case-folded once instead.
+        self._pattern = re.compile(
+            r"(?=((?:(?<!\w)|(?=\W))" + self._trie_pattern(trie) + "))"
+        )
+        # Shortest suffix first: the trie prefers the longest keyword, so the
+        # longest stem that is a keyword is the one that matched.
+        self._suffixes = sorted(SUFFIXES, key=len)
+
+    _suffix_pattern = "(?:" + "|".join(sorted(SUFFIXES, key=len, reverse=True)) + ")?"
+
+    @classmethod
+    def _trie_pattern(cls, node: dict) -> str:
+        alternatives = [
+            re.escape(char) + cls._trie_pattern(child)
+            for char, child in sorted(node.items())
+            if char
+        ]
+        if "" in node:
+            # Word boundaries only apply next to word characters, so punctuation
+            # keywords like "," still match anywhere.
+            last = node[""][-1]
+            if last.isalpha():
+                alternatives.append(cls._suffix_pattern + r"\b")
+            else:
+                alternatives.append(r"\b" if last.isalnum() else "")
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return "(?:" + "|".join(alternatives) + ")"
+
+    @staticmethod
+    def _is_word_prefix(prefix: str, phrase: str) -> bool:
+        if not phrase.startswith(prefix) or len(phrase) == len(prefix):
+            return False
+        return not (prefix[-1].isalnum() and phrase[len(prefix)].isalnum())
+
+    def _keyword(self, found: str):
+        """Maps a matched word (possibly inflected) back to its keyword, or None."""
+        if found in self._phrase_categories:
+            return found
+        for suffix in self._suffixes:
+            stem = found[:-len(suffix)]
+            if found.endswith(suffix) and stem in self._phrase_categories:
+                return stem
+        return None
+
+    def match(self, text: str) -> Counter:
+        hits = Counter()
+        phrase_categories = self._phrase_categories
+        text = fold(text)
+        for found in self._pattern.finditer(text):
+            keyword = self._keyword(found.group(1))
+            if keyword is None:
+                continue
+            names = phrase_categories[keyword]
+            if self.negatable.intersection(names) and self._negated(text, found.start(1)):
+                names = [name for name in names if name not in self.negatable]
+            hits.update(names)
+        return hits
+
+    @staticmethod
+    def _negated(text: str, start: int) -> bool:
+        return NEGATION.search(text, max(0, start - 40), start) is not None
@@ -0,0 +1,209 @@
+"""
+Load Generator
+Drives POST /chat either at a fixed concurrency (closed loop: each worker
+sends its next request as soon as the last one returns) or at a fixed
+arrival rate (open loop: Poisson arrivals, whatever the server's speed).
+Reports throughput, status codes and p50/p95/p99 latency end to end and
+for every stage of the turn, using the server's timings_ms.
+
+Runs fully offline against the fake model:
+    LLM_PROVIDER=fake FAKE_LLM_LATENCY_MS=300 FAKE_LLM_LATENCY_P99_MS=2000 uvicorn app:app
+    python loadgen.py --concurrency 32 --duration 30
+    python loadgen.py --rate 50 --duration 30 --unique
+
+In open-loop mode latency is measured from each request's scheduled send
+time, so a backed-up client doesn't hide server queueing.
+
+Usage: python loadgen.py [--url URL] (--concurrency N | --rate R) [--duration S | --requests N]
+                         [--users N] [--unique] [--detail-mode MODE] [--json FILE]
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+QUERIES = [
+    "What are the symptoms of diabetes?",
+    "I have had a headache and mild fever since yesterday, what should I do?",
+    "My child has a rash on his arms after playing outside, should I be worried?",
+    "Can you suggest a good cardiologist in Bangalore? I get chest discomfort when climbing stairs.",
+    "I'm feeling very anxious and can't sleep at night",
+    "How can I lower my blood pressure naturally?",
+    "My knee hurts when I climb stairs, is it arthritis?",
+    "What should I eat to recover faster from the flu?",
+    "I twisted my ankle yesterday and it is swollen",
+    "Is it safe to take ibuprofen with paracetamol?",
+]
+
+_local = threading.local()
+
+
+def http() -> requests.Session:
+    """One keep-alive session per worker thread."""
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def percentile(values: list, p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))]
+
+
+class Results:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies_ms = []
+        self.stages_ms = defaultdict(list)
+        self.statuses = Counter()
+        self.caches = Counter()
+
+    def add(self, status, latency_ms: float, body: dict = None):
+        with self._lock:
+            self.statuses[status] += 1
+            if status != 200:
+                return
+            self.latencies_ms.append(latency_ms)
+            for stage, ms in (body.get("timings_ms") or {}).items():
+                self.stages_ms[stage].append(ms)
+            self.caches[(body.get("cache") or {}).get("type", "miss")] += 1
+
+
+def send(args, results: Results, n: int, scheduled: float):
+    query = QUERIES[n % len(QUERIES)]
+    if args.unique:
+        # Defeat the response and near-duplicate caches
+        query = f"{query} (case {n})"
+    payload = {
+        "user_input": query,
+        "user_id": f"load-user-{n % args.users}",
+        "include_timings": True,
+    }
+    if args.detail_mode:
+        payload["detail_mode"] = args.detail_mode
+    try:
+        response = http().post(args.url.rstrip("/") + "/chat", json=payload, timeout=args.timeout)
+        latency_ms = (time.perf_counter() - scheduled) * 1000
+        body = response.json() if response.status_code == 200 else None
+        results.add(response.status_code, latency_ms, body)
+    except (requests.RequestException, ValueError) as e:
+        results.add(type(e).__name__, (time.perf_counter() - scheduled) * 1000)
+
+
+def run_closed_loop(args, results: Results) -> float:
+    counter = iter(range(10**12))
+    counter_lock = threading.Lock()
+    started = time.perf_counter()
+    deadline = started + args.duration
+
+    def worker():
+        while time.perf_counter() < deadline:
+            with counter_lock:
+                n = next(counter)
+            if args.requests and n >= args.requests:
+                return
+            send(args, results, n, time.perf_counter())
+
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def run_open_loop(args, results: Results) -> float:
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    deadline = started + args.duration
+    scheduled = started
+    n = 0
+    with ThreadPoolExecutor(max_workers=args.max_inflight) as pool:
+        while True:
+            scheduled += rng.expovariate(args.rate)
+            if scheduled >= deadline or (args.requests and n >= args.requests):
+                break
+            time.sleep(max(0.0, scheduled - time.perf_counter()))
+            pool.submit(send, args, results, n, scheduled)
+            n += 1
+    return time.perf_counter() - started
+
+
+def summarize(values: list) -> dict:
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": values[-1] if values else 0.0,
+    }
+
+
+def report(args, results: Results, elapsed: float) -> dict:
+    ok = results.statuses.get(200, 0)
+    total = sum(results.statuses.values())
+    summary = {
+        "mode": f"rate={args.rate}/s" if args.rate else f"concurrency={args.concurrency}",
+        "elapsed_s": round(elapsed, 3),
+        "requests": total,
+        "ok": ok,
+        "throughput_rps": round(ok / elapsed, 2) if elapsed else 0.0,
+        "statuses": {str(status): count for status, count in results.statuses.items()},
+        "cache": dict(results.caches),
+        "latency_ms": summarize(results.latencies_ms),
+        "stages_ms": {stage: summarize(values) for stage, values in results.stages_ms.items()},
+    }
+
+    print("=" * 80)
+    print("LOAD TEST RESULTS".center(80))
+    print("=" * 80)
+    print(f"Mode:        {summary['mode']}, {args.users} users")
+    print(f"Requests:    {total} sent, {ok} ok in {elapsed:.1f}s")
+    print(f"Throughput:  {summary['throughput_rps']} req/s")
+    print(f"Statuses:    {summary['statuses']}")
+    print(f"Cache:       {summary['cache']}")
+    print()
+    print(f"{'stage':<14}{'count':>8}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}{'max ms':>12}")
+    print("-" * 70)
+    rows = [("end-to-end", summary["latency_ms"])] + sorted(summary["stages_ms"].items())
+    for stage, s in rows:
+        print(f"{stage:<14}{s['count']:>8}{s['p50']:>12.1f}{s['p95']:>12.1f}{s['p99']:>12.1f}{s['max']:>12.1f}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--concurrency", type=int, default=16, help="closed loop: requests in flight")
+    mode.add_argument("--rate", type=float, help="open loop: average arrivals per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--requests", type=int, default=0, help="stop after this many requests (0 = no limit)")
+    parser.add_argument("--users", type=int, default=100, help="distinct user ids (each keeps a session)")
+    parser.add_argument("--unique", action="store_true", help="make every query distinct to bypass caches")
+    parser.add_argument("--detail-mode", default=None)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--max-inflight", type=int, default=1024, help="open loop: client thread cap")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the summary to this file")
+    args = parser.parse_args()
+
+    results = Results()
+    elapsed = run_open_loop(args, results) if args.rate else run_closed_loop(args, results)
+    summary = report(args, results, elapsed)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Minimal Prometheus instrumentation.
+Histograms and callback gauges rendered in the Prometheus text exposition
+format, without a client library. Observing a value is a bisect and a
+couple of list updates, so per-request overhead stays in the microseconds.
+"""
+from bisect import bisect_left
+
+_INF = 'le="+Inf"'
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+    """
+    Prometheus histogram keyed by a tuple of label values, in the order
+    of `label_names`. Bucket counts are stored per bucket and made
+    cumulative only when rendered.
+    """
+
+    def __init__(self, name: str, help_text: str, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, value: float, labels: tuple = ()):
+        series = self._series.get(labels)
+        if series is None:
+            # [per-bucket counts (+Inf last), sum, count]
+            series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            self._series[labels] = series
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in list(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, _INF)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total!r}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class Registry:
+    """Histograms plus gauges whose values are read from a callback at scrape time."""
+
+    def __init__(self):
+        self._histograms = []
+        self._gauges = []
+
+    def histogram(self, name: str, help_text: str, label_names=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        histogram = Histogram(name, help_text, label_names, buckets)
+        self._histograms.append(histogram)
+        return histogram
+
+    def gauge(self, name: str, help_text: str, label_names, fn):
+        """`fn()` returns {label values tuple: value}."""
+        self._gauges.append((name, help_text, tuple(label_names), fn))
+
+    def render(self) -> str:
+        lines = []
+        for histogram in self._histograms:
+            lines.extend(histogram.render())
+        for name, help_text, label_names, fn in self._gauges:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in fn().items():
+                lines.append(f"{name}{_labels(label_names, labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
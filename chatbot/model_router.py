@@ -0,0 +1,68 @@
+"""
+Complexity-based model routing.
+Simple, low-risk turns go to a faster, cheaper model tier; complicated or
+emergency cases go to the stronger tier. The decision uses only signals
+computed locally before the LLM call.
+"""
+import logging
+from collections import Counter
+
+FAST = "fast"
+STRONG = "strong"
+
+logger = logging.getLogger("chatbot.router")
+
+
+class ModelRouter:
+    """
+    Routes a turn to the STRONG tier when any rule fires, else to FAST:
+
+    - it is an emergency or `is_complicated` was detected
+    - its specialty is in `strong_specialties`
+    - the message is longer than `max_fast_chars`
+    - the conversation history is over `max_fast_history_tokens`
+
+    When disabled every turn goes to the strong tier.
+    """
+
+    def __init__(self, enabled: bool = False, max_fast_chars: int = 280, max_fast_history_tokens: int = 400,
+                 strong_specialties=("cardiac", "psychiatry", "pediatric")):
+        self.enabled = enabled
+        self.max_fast_chars = max_fast_chars
+        self.max_fast_history_tokens = max_fast_history_tokens
+        self.strong_specialties = set(strong_specialties)
+        self.tiers = Counter()
+        self.reasons = Counter()
+
+    def route(self, user_input: str, location_data: dict, emergency, history_tokens: int) -> dict:
+        """Returns {"tier": "fast" or "strong", "reasons": [rules that fired]}."""
+        if not self.enabled:
+            return {"tier": STRONG, "reasons": ["routing_disabled"]}
+        reasons = []
+        if emergency:
+            reasons.append("emergency")
+        if location_data["is_complicated"]:
+            reasons.append("complicated")
+        if location_data["specialty"] in self.strong_specialties:
+            reasons.append("specialty:" + location_data["specialty"])
+        if len(user_input) > self.max_fast_chars:
+            reasons.append("long_message")
+        if history_tokens > self.max_fast_history_tokens:
+            reasons.append("long_history")
+
+        tier = STRONG if reasons else FAST
+        self.tiers[tier] += 1
+        self.reasons.update(reasons)
+        logger.info("route tier=%s reasons=%s chars=%d history_tokens=%d",
+                    tier, ",".join(reasons) or "-", len(user_input), history_tokens)
+        return {"tier": tier, "reasons": reasons}
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "max_fast_chars": self.max_fast_chars,
+            "max_fast_history_tokens": self.max_fast_history_tokens,
+            "strong_specialties": sorted(self.strong_specialties),
+            "tiers": dict(self.tiers),
+            "reasons": dict(self.reasons),
+        }
@@ -0,0 +1,180 @@
+"""
+Near-duplicate question index over normalized questions.
+Lets paraphrased first-turn questions ("flu symptoms?", "symptoms of the
+flu") reuse a stored answer without another LLM call. Questions that
+differ in a drug, a condition, a number or a unit are never matched,
+however similar the rest is.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_TOKEN = re.compile(r"[a-z0-9']+")
+
+# Filler words that don't change what is being asked. Negations ("not", "no"),
+# question words ("when" vs "why"), modals ("can" vs "should") and
+# conjunctions ("and" vs "or") are deliberately kept because they change
+# what is being asked.
+STOPWORDS = frozenset("""
+a about am an any are as at be do does for from get have i i'm im in is it
+its me my of on please tell the to was with you your
+""".split())
+
+# Different words for the same thing, folded into one token before comparing
+SYNONYMS = {
+    "influenza": "flu",
+    "sign": "symptom",
+    "kid": "child",
+    "children": "child",
+    "toddler": "child",
+    "paracetamol": "acetaminophen",
+    "tylenol": "acetaminophen",
+    "treat": "treatment",
+    "cure": "treatment",
+    "remedy": "treatment",
+    "medicine": "medication",
+    "medicines": "medication",
+    "drug": "medication",
+    "whats": "what",
+    "what's": "what",
+    "belly": "stomach",
+    "tummy": "stomach",
+}
+
+# Generic words that may differ between two questions without changing the
+# answer. Anything else that differs (a drug, a condition, a number, a unit)
+# refuses the match.
+INTERCHANGEABLE = frozenset("""
+common main usual typical general some list explain know like kind type
+""".split())
+
+
+def normalize_question(question: str) -> frozenset:
+    """
+    Reduces a question to its set of content words (lowercased, stopwords
+    removed, plural "s" stripped, synonyms folded) so word order and filler
+    don't matter.
+    """
+    tokens = set()
+    for token in _TOKEN.findall(question.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.add(SYNONYMS.get(token, token))
+    return frozenset(tokens)
+
+
+class NearDuplicateIndex:
+    """
+    In-process index of normalized questions.
+
+    A stored question matches a query if every content word they don't
+    share is INTERCHANGEABLE, i.e. both have the same set of remaining
+    "core" words, and the Jaccard similarity of their token sets is at
+    least `threshold`. Entries are keyed by (namespace, core words), so a
+    lookup is a single dict probe however many questions are stored.
+    Numbers and units are never interchangeable, so "12 kg" never matches
+    "20 kg". The default threshold of 1.0 requires the same set of content
+    words. Entries are grouped by `namespace` (e.g. the detected emotion)
+    and the index keeps at most `max_entries`, dropping the oldest first.
+    """
+
+    def __init__(self, threshold: float = 1.0, max_entries: int = 100_000, ttl_seconds: float = 0):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._by_key = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def _key(namespace: str, tokens: frozenset) -> tuple:
+        return (namespace, tokens - INTERCHANGEABLE)
+
+    def query(self, question: str, namespace: str = ""):
+        """
+        Returns {"answer", "score", "question"} for the most similar stored
+        question at or above the threshold, or None.
+        """
+        tokens = normalize_question(question)
+        if not tokens:
+            return None
+
+        best_id, best_score = None, 0.0
+        with self._lock:
+            for entry_id in self._by_key.get(self._key(namespace, tokens), ()):
+                other = self._entries[entry_id]["tokens"]
+                score = len(tokens & other) / len(tokens | other)
+                if score > best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None or best_score < self.threshold:
+                self.misses += 1
+                return None
+
+            entry = self._entries[best_id]
+            if self.ttl_seconds and time.monotonic() - entry["stored_at"] > self.ttl_seconds:
+                self._remove(best_id)
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return {
+                "answer": entry["answer"],
+                "score": round(best_score, 4),
+                "question": entry["question"],
+            }
+
+    def add(self, question: str, answer: str, namespace: str = ""):
+        if not self.enabled:
+            return
+        tokens = normalize_question(question)
+        if not tokens:
+            return
+
+        key = self._key(namespace, tokens)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "tokens": tokens,
+                "key": key,
+                "question": question,
+                "answer": answer,
+                "stored_at": time.monotonic(),
+            }
+            self._by_key.setdefault(key, set()).add(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        ids = self._by_key.get(entry["key"])
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._by_key[entry["key"]]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
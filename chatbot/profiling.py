@@ -0,0 +1,184 @@
+"""
+Opt-in per-request profiling.
+A request sent with the X-Profile header runs under a sampling profiler
+that records collapsed stacks (the flamegraph.pl / speedscope format) of
+the event loop thread and the threadpool workers. Each result is stored
+in a bounded on-disk ring. The middleware is only installed when
+profiling is enabled, so normal deployments pay nothing.
+"""
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+PROFILE_HEADER = b"x-profile"
+_PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+def token_matches(token: str, value) -> bool:
+    """True if `value` equals the configured token (compared in constant time); never without a token."""
+    if not token:
+        return False
+    return value is not None and hmac.compare_digest(value.encode("latin-1"), token.encode("latin-1"))
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of the calling thread, plus the threadpool workers
+    (Starlette's run_in_threadpool and asyncio.to_thread), every `interval`
+    seconds from a background thread.
+    """
+
+    def __init__(self, interval: float = 0.001, worker_prefixes=("AnyIO worker thread", "asyncio_")):
+        self.interval = interval
+        self.worker_prefixes = tuple(worker_prefixes)
+        self.samples = Counter()
+        self.sample_count = 0
+        self._target = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _threads(self) -> dict:
+        names = {self._target: "event-loop"}
+        for thread in threading.enumerate():
+            if thread.name.startswith(self.worker_prefixes):
+                names[thread.ident] = "worker"
+        return names
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            # Re-listed every tick: workers may be started mid-request
+            names = self._threads()
+            frames = sys._current_frames()
+            for ident, name in names.items():
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(name)
+                self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class ProfileStore:
+    """Keeps the newest `max_profiles` profiles as files in `directory`."""
+
+    def __init__(self, directory: str, max_profiles: int = 20):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, profile_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, profile_id + suffix)
+
+    def save(self, profile_id: str, collapsed: str, meta: dict):
+        with self._lock:
+            with open(self._path(profile_id, ".collapsed"), "w", encoding="utf-8") as f:
+                f.write(collapsed)
+            with open(self._path(profile_id, ".json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            profiles = self.list()
+            for old in profiles[self.max_profiles:]:
+                for suffix in (".collapsed", ".json"):
+                    try:
+                        os.remove(self._path(old["id"], suffix))
+                    except FileNotFoundError:
+                        pass
+
+    def list(self) -> list:
+        """Profile metadata, newest first."""
+        profiles = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        profiles.sort(key=lambda meta: meta["created"], reverse=True)
+        return profiles
+
+    def path(self, profile_id: str):
+        """Path of a stored profile, or None for unknown or malformed ids."""
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        path = self._path(profile_id, ".collapsed")
+        return path if os.path.exists(path) else None
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles requests to `paths` carrying the
+    X-Profile header whose value equals `token`. Without a token nothing
+    is profiled.
+    The whole handler runs under the profiler, including body parsing,
+    validation and serialization; the response gets an X-Profile-Id header.
+    """
+
+    def __init__(self, app, store: ProfileStore, paths=("/chat",), token: str = None, interval: float = 0.001):
+        self.app = app
+        self.store = store
+        self.paths = set(paths)
+        self.token = token
+        self.interval = interval
+        self.profiled = 0
+
+    def _wants_profile(self, scope) -> bool:
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            return False
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                return token_matches(self.token, value.decode("latin-1"))
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if not self._wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        profiler = SamplingProfiler(self.interval)
+        started = time.time()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.stop()
+            self.profiled += 1
+            self.store.save(profile_id, profiler.collapsed(), {
+                "id": profile_id,
+                "path": scope["path"],
+                "created": started,
+                "duration_ms": round((time.time() - started) * 1000, 3),
+                "samples": profiler.sample_count,
+                "interval_ms": self.interval * 1000,
+            })
@@ -0,0 +1,184 @@
+"""
+Async rate limiting and retry primitives for LLM calls.
+All waiting is done with asyncio.sleep, so throttled requests never hold
+a thread.
+"""
+import asyncio
+import random
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` tokens per second up to `capacity`.
+
+    `acquire` reserves tokens immediately (the balance may go negative) and
+    then sleeps until the reservation is covered, so waiters are served in
+    arrival order without holding a thread. A waiter cancelled during the
+    sleep returns its reservation.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self.acquired = 0
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """Takes `amount` tokens, waiting if needed. Returns seconds waited."""
+        self._refill()
+        self._tokens -= amount
+        self.acquired += 1
+        if self._tokens >= 0:
+            return 0.0
+        wait = -self._tokens / self.rate
+        self.throttled += 1
+        self.throttled_seconds += wait
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            # The caller went away (e.g. the client disconnected), so later
+            # waiters must not keep waiting for tokens nobody will use
+            self.release(amount)
+            raise
+        return wait
+
+    def release(self, amount: float = 1.0):
+        """Returns tokens taken by an acquire whose call never happened."""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + amount)
+        self.acquired -= 1
+
+    def stats(self) -> dict:
+        self._refill()
+        return {
+            "rate_per_second": self.rate,
+            "capacity": self.capacity,
+            "available": round(self._tokens, 3),
+            "acquired": self.acquired,
+            "throttled": self.throttled,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+        }
+
+
+class LLMRateLimiter:
+    """
+    Client-side limiter matching a model's requests-per-minute and
+    tokens-per-minute quota. A limit of 0 disables that dimension.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute / 60, requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute / 60, tokens_per_minute) if tokens_per_minute else None
+        self.throttled_seconds = 0.0
+
+    async def acquire(self, prompt_tokens: int) -> float:
+        waited = 0.0
+        if self.requests:
+            waited += await self.requests.acquire(1)
+        if self.tokens:
+            try:
+                waited += await self.tokens.acquire(min(prompt_tokens, self.tokens.capacity))
+            except asyncio.CancelledError:
+                if self.requests:
+                    self.requests.release(1)
+                raise
+        self.throttled_seconds += waited
+        return waited
+
+    def stats(self) -> dict:
+        return {
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "requests": self.requests.stats() if self.requests else None,
+            "tokens": self.tokens.stats() if self.tokens else None,
+        }
+
+
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+_TRANSIENT_MARKERS = ("429", "quota", "resource has been exhausted", "resource exhausted",
+                      "rate limit", "503", "unavailable", "deadline exceeded", "internal error")
+
+
+def is_transient_error(e: Exception) -> bool:
+    """True for rate-limit (429), server-side (5xx) and timeout errors worth retrying."""
+    if isinstance(e, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    for attr in ("code", "status_code"):
+        code = getattr(e, attr, None)
+        code = getattr(code, "value", code)
+        if isinstance(code, int):
+            return code in TRANSIENT_STATUS_CODES
+    message = str(e).lower()
+    return any(marker in message for marker in _TRANSIENT_MARKERS)
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter, bounded by a retry budget.
+
+    Each call may be attempted up to `max_attempts` times. Every success
+    deposits `budget_ratio` into the budget and every retry withdraws 1, so
+    under a sustained outage retries stay at roughly `budget_ratio` of
+    traffic instead of multiplying the load.
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 budget_ratio: float = 0.1, budget_max: float = 10.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.budget_max = budget_max
+        self._budget = budget_max
+        self.calls = 0
+        self.retries = 0
+        self.retry_sleep_seconds = 0.0
+        self.budget_exhausted = 0
+        self.failures = 0
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def run(self, fn):
+        """Awaits `fn()` and retries transient failures."""
+        self.calls += 1
+        attempt = 0
+        while True:
+            try:
+                result = await fn()
+            except Exception as e:
+                attempt += 1
+                if not is_transient_error(e) or attempt >= self.max_attempts:
+                    self.failures += 1
+                    raise
+                if self._budget < 1:
+                    self.budget_exhausted += 1
+                    self.failures += 1
+                    raise
+                self._budget -= 1
+                self.retries += 1
+                delay = self.backoff(attempt)
+                self.retry_sleep_seconds += delay
+                await asyncio.sleep(delay)
+                continue
+            self._budget = min(self.budget_max, self._budget + self.budget_ratio)
+            return result
+
+    def stats(self) -> dict:
+        return {
+            "max_attempts": self.max_attempts,
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "budget_available": round(self._budget, 2),
+            "budget_exhausted": self.budget_exhausted,
+            "retry_sleep_seconds": round(self.retry_sleep_seconds, 3),
+        }
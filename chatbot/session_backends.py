@@ -0,0 +1,141 @@
+"""
+Storage backends for SessionStore.
+The in-memory backend keeps sessions only in the worker's own cache; the
+SQLite backend persists them so several uvicorn workers (or processes on
+one box) can serve the same user.
+"""
+import json
+import sqlite3
+import threading
+import time
+
+
+class SessionBackend:
+    """
+    Interface for session persistence.
+
+    `load` returns the stored dict for a user (or None), `save_many` writes
+    a batch of (user_id, dict) pairs in one go, `purge_idle` removes rows
+    not updated for `idle_ttl` seconds.
+    """
+
+    persistent = False
+
+    def load(self, user_id: str):
+        raise NotImplementedError
+
+    def save_many(self, items: list):
+        raise NotImplementedError
+
+    def purge_idle(self, idle_ttl: float) -> int:
+        return 0
+
+    def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"type": type(self).__name__}
+
+
+class InMemorySessionBackend(SessionBackend):
+    """
+    Default backend: nothing is persisted, the SessionStore's own dict is
+    the only copy. Only suitable for a single worker process.
+    """
+
+    def load(self, user_id: str):
+        return None
+
+    def save_many(self, items: list):
+        pass
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """
+    Stores each session as a JSON row in a WAL-mode SQLite database, so
+    readers in other workers are never blocked by the single writer.
+    """
+
+    persistent = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._conns = []
+        self._conns_lock = threading.Lock()
+        self.loads = 0
+        self.rows_written = 0
+        self.batches_written = 0
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " user_id TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions(updated_at)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        # Each thread (request threads, the flusher, to_thread workers) gets its
+        # own connection; they are all tracked so close() can close them.
+        # check_same_thread is off only so close() may run on another thread.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    @staticmethod
+    def _key(user_id) -> str:
+        return "" if user_id is None else str(user_id)
+
+    def load(self, user_id: str):
+        self.loads += 1
+        row = self._conn().execute(
+            "SELECT data FROM sessions WHERE user_id = ?", (self._key(user_id),)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_many(self, items: list):
+        if not items:
+            return
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT INTO sessions (user_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                [(self._key(user_id), json.dumps(data), now) for user_id, data in items],
+            )
+        self.rows_written += len(items)
+        self.batches_written += 1
+
+    def purge_idle(self, idle_ttl: float) -> int:
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                "DELETE FROM sessions WHERE updated_at < ?", (time.time() - idle_ttl,)
+            )
+        return cursor.rowcount
+
+    def close(self):
+        """Closes every thread's connection; call once no thread uses the backend."""
+        with self._conns_lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            conn.close()
+        self._local = threading.local()
+
+    def stats(self) -> dict:
+        return {
+            "type": type(self).__name__,
+            "path": self.path,
+            "loads": self.loads,
+            "rows_written": self.rows_written,
+            "batches_written": self.batches_written,
+        }
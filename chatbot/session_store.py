@@ -0,0 +1,523 @@
+"""
+Bounded per-user session storage.
+Replaces the old ever-growing user_memory dict: sessions expire after an
+idle TTL, the number of sessions is capped, and each session only keeps
+as much history as the prompt actually uses.
+"""
+import asyncio
+import logging
+import re
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque, namedtuple
+
+from session_backends import InMemorySessionBackend
+from tokens import estimate_tokens
+
+logger = logging.getLogger("chatbot.sessions")
+
+Message = namedtuple("Message", ["type", "content"])
+
+# Assistant replies end with generated hospital lists / urgency notes; those
+# are rebuilt every turn, so they're left out of the summary.
+_APPENDIX_MARKERS = ("\n⚠️ **IMPORTANT:**", "**🏥 Recommended Hospitals")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def summarize_message(msg: Message, max_words: int = 30) -> str:
+    """
+    One-line extractive summary of a message: its first sentence, with any
+    hospital appendix removed, capped at `max_words` words.
+    """
+    text = msg.content
+    for marker in _APPENDIX_MARKERS:
+        cut = text.find(marker)
+        if cut != -1:
+            text = text[:cut]
+    text = " ".join(text.split())
+    first_sentence = _SENTENCE_END.split(text, maxsplit=1)[0]
+    words = first_sentence.split()
+    if len(words) > max_words:
+        first_sentence = " ".join(words[:max_words]) + " ..."
+    role = "User" if msg.type == "human" else "Assistant"
+    return f"- {role}: {first_sentence}"
+
+
+class Session:
+    """
+    Conversation state for one user, held in fixed-size ring buffers.
+
+    `messages` keeps at most `history_size` recent messages, and their
+    rendered prompt lines are kept alongside so history is never rebuilt
+    from scratch. When the recent messages exceed `token_budget` (or the
+    count limit), the oldest ones are folded into a rolling one-line-per-
+    message summary that is itself capped at `summary_budget` tokens.
+
+    Changes and snapshots take the session's `lock`, so the write-behind
+    thread never sees a half-applied turn.
+    """
+
+    __slots__ = (
+        "lock", "messages", "sentiment_history", "last_seen", "loaded_at", "version", "saved_version",
+        "history_size", "token_budget", "summary_budget",
+        "_lines", "_history_tokens", "_summary", "_summary_tokens",
+        "_raw_tokens", "_rendered",
+    )
+
+    def __init__(self, history_size: int, sentiment_size: int,
+                 token_budget: int = 1000, summary_budget: int = 200):
+        self.lock = threading.Lock()
+        self.history_size = history_size
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.messages = deque()
+        self.sentiment_history = deque(maxlen=sentiment_size)
+        self.last_seen = time.monotonic()
+        self.loaded_at = self.last_seen
+        # Bumped by every change and stored with the session, so a reload can
+        # tell whether the stored copy is newer; saved_version is the last one written
+        self.version = 0
+        self.saved_version = 0
+        self._lines = deque()
+        self._history_tokens = 0
+        self._summary = deque()
+        self._summary_tokens = 0
+        # Token sizes of the last `history_size` messages verbatim, i.e. what
+        # the unbudgeted prompt would have sent; kept only for reporting.
+        self._raw_tokens = deque(maxlen=history_size)
+        self._rendered = ""
+
+    def add_user_message(self, content: str):
+        with self.lock:
+            self._append(Message("human", content))
+            self.version += 1
+
+    def add_ai_message(self, content: str):
+        with self.lock:
+            self._append(Message("ai", content))
+            self.version += 1
+
+    def add_exchange(self, user_content: str, ai_content: str):
+        """Appends a user message and its reply as one step."""
+        with self.lock:
+            self._append(Message("human", user_content))
+            self._append(Message("ai", ai_content))
+            self.version += 1
+
+    def add_sentiment(self, entry: dict):
+        with self.lock:
+            self.sentiment_history.append(entry)
+            self.version += 1
+
+    def has_unsaved_changes(self) -> bool:
+        return self.version != self.saved_version
+
+    def is_empty(self) -> bool:
+        return not self.messages and not self._summary
+
+    def _append(self, msg: Message):
+        role = "User" if msg.type == "human" else "Assistant"
+        line = f"{role}: {msg.content}\n"
+        tokens = estimate_tokens(line)
+        self.messages.append(msg)
+        self._lines.append((line, tokens))
+        self._history_tokens += tokens
+        self._raw_tokens.append(tokens)
+
+        while self.messages and (
+            len(self.messages) > self.history_size or self._history_tokens > self.token_budget
+        ):
+            self._fold(self.messages.popleft())
+            _, folded_tokens = self._lines.popleft()
+            self._history_tokens -= folded_tokens
+        self._render()
+
+    def _fold(self, msg: Message):
+        line = summarize_message(msg)
+        tokens = estimate_tokens(line)
+        self._summary.append((line, tokens))
+        self._summary_tokens += tokens
+        while len(self._summary) > 1 and self._summary_tokens > self.summary_budget:
+            _, dropped = self._summary.popleft()
+            self._summary_tokens -= dropped
+
+    def _render(self):
+        parts = []
+        if self._summary:
+            parts.append("Summary of earlier conversation:\n")
+            parts.extend(line + "\n" for line, _ in self._summary)
+            parts.append("Recent messages:\n")
+        parts.extend(line for line, _ in self._lines)
+        self._rendered = "".join(parts)
+
+    def render_history(self) -> str:
+        """History text for the prompt: rolling summary plus recent messages."""
+        return self._rendered
+
+    def history_tokens(self) -> int:
+        return estimate_tokens(self._rendered)
+
+    def unbudgeted_history_tokens(self) -> int:
+        """Tokens the last `history_size` messages would cost sent verbatim."""
+        with self.lock:
+            return sum(self._raw_tokens)
+
+    def to_dict(self) -> dict:
+        return self.snapshot()[0]
+
+    def snapshot(self) -> tuple:
+        """(to_dict(), the version it reflects), taken atomically."""
+        with self.lock:
+            return {
+                "messages": [list(msg) for msg in self.messages],
+                "summary": [line for line, _ in self._summary],
+                "raw_tokens": list(self._raw_tokens),
+                "sentiment_history": list(self.sentiment_history),
+                "version": self.version,
+            }, self.version
+
+    @classmethod
+    def from_dict(cls, data: dict, history_size: int, sentiment_size: int,
+                  token_budget: int = 1000, summary_budget: int = 200) -> "Session":
+        session = cls(history_size, sentiment_size, token_budget, summary_budget)
+        for line in data.get("summary", []):
+            session._summary.append((line, estimate_tokens(line)))
+            session._summary_tokens += estimate_tokens(line)
+        for msg in data.get("messages", []):
+            session._append(Message(*msg))
+        session._raw_tokens.clear()
+        session._raw_tokens.extend(data.get("raw_tokens", []))
+        session._render()
+        session.sentiment_history.extend(data.get("sentiment_history", []))
+        session.version = session.saved_version = data.get("version", 0)
+        return session
+
+    def refresh(self, data: dict) -> bool:
+        """
+        Replaces the contents with a newer stored copy in place, so callers
+        already holding this session keep working on the live object.
+        Does nothing (and returns False) if this copy has unsaved changes or
+        the stored copy is not newer, e.g. read just before the last flush.
+        """
+        fresh = Session.from_dict(data, self.history_size, self.sentiment_history.maxlen,
+                                  self.token_budget, self.summary_budget)
+        with self.lock:
+            if self.has_unsaved_changes():
+                return False
+            self.loaded_at = time.monotonic()
+            if fresh.version <= self.saved_version:
+                return False
+            for name in ("messages", "sentiment_history", "_lines", "_history_tokens",
+                         "_summary", "_summary_tokens", "_raw_tokens", "_rendered"):
+                setattr(self, name, getattr(fresh, name))
+            self.version = self.saved_version = fresh.version
+            return True
+
+    def footprint(self) -> int:
+        """Approximate resident size of this session in bytes."""
+        with self.lock:
+            size = sys.getsizeof(self) + sys.getsizeof(self.messages) + sys.getsizeof(self.sentiment_history)
+            for msg in self.messages:
+                size += sys.getsizeof(msg) + sys.getsizeof(msg.content)
+            for line, _ in self._lines:
+                size += sys.getsizeof(line)
+            for line, _ in self._summary:
+                size += sys.getsizeof(line)
+            size += sys.getsizeof(self._rendered)
+            for entry in self.sentiment_history:
+                size += sys.getsizeof(entry) + sum(sys.getsizeof(v) for v in entry.values())
+            return size
+
+
+class _Shard:
+    """One slice of the session map with its own lock and LRU order."""
+
+    __slots__ = ("lock", "sessions", "turn_locks", "created", "expired", "evicted", "cache_hits", "cache_misses")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict()
+        # A user's entry lives only while some turn for them is running or waiting
+        self.turn_locks = weakref.WeakValueDictionary()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+class SessionStore:
+    """
+    LRU map of user_id -> Session with an idle TTL and a session cap.
+
+    The map is split into `shards` slices by hash(user_id), each with its
+    own lock, LRU order and share of `max_sessions`, so requests for
+    different users don't contend. Sessions idle for longer than
+    `idle_ttl` seconds are dropped lazily on access; when a shard is over
+    its share, its least recently used session is evicted.
+
+    `turn_lock(user_id)` serializes whole turns for one user (read the
+    history, call the LLM, append the reply) while other users proceed in
+    parallel.
+
+    With a persistent `backend` the map acts as a read-through cache:
+    entries older than `read_cache_ttl` seconds are reloaded so turns
+    served by other workers are picked up, and changes reported through
+    `mark_dirty` are written behind in batches every `flush_interval`
+    seconds by a background thread.
+    """
+
+    def __init__(self, max_sessions: int = 10_000, idle_ttl: float = 3600,
+                 history_size: int = 10, sentiment_size: int = 50,
+                 token_budget: int = 1000, summary_budget: int = 200,
+                 backend=None, read_cache_ttl: float = 1.0, flush_interval: float = 0.2,
+                 shards: int = 16):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.history_size = history_size
+        self.sentiment_size = sentiment_size
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.backend = backend or InMemorySessionBackend()
+        self.read_cache_ttl = read_cache_ttl
+        self.flush_interval = flush_interval
+        self._shards = [_Shard() for _ in range(max(1, shards))]
+        self._shard_capacity = max(1, -(-max_sessions // len(self._shards)))
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+        self._stop = threading.Event()
+        self.flushes = 0
+        self.flush_errors = 0
+
+    def _shard(self, user_id: str) -> _Shard:
+        return self._shards[hash(user_id) % len(self._shards)]
+
+    def _expire_idle(self, shard: _Shard, now: float):
+        # The OrderedDict is in access order, so idle sessions sit at the front
+        while shard.sessions:
+            user_id, session = next(iter(shard.sessions.items()))
+            if now - session.last_seen <= self.idle_ttl:
+                break
+            del shard.sessions[user_id]
+            shard.expired += 1
+
+    def _cached(self, shard: _Shard, user_id: str, now: float):
+        session = shard.sessions.get(user_id)
+        if session is None:
+            return None
+        if self.backend.persistent and user_id not in self._pending:
+            # A change made between a flush's snapshot and the next mark_dirty
+            # is only in this copy, so it must not be replaced by a reload
+            if now - session.loaded_at > self.read_cache_ttl and not session.has_unsaved_changes():
+                return None
+        session.last_seen = now
+        shard.sessions.move_to_end(user_id)
+        return session
+
+    def _insert(self, shard: _Shard, user_id: str, session: Session):
+        shard.sessions[user_id] = session
+        shard.sessions.move_to_end(user_id)
+        while len(shard.sessions) > self._shard_capacity:
+            # Unflushed sessions stay referenced by _pending, so nothing is lost
+            shard.sessions.popitem(last=False)
+            shard.evicted += 1
+
+    def _lookup(self, shard: _Shard, user_id: str):
+        # Caller holds shard.lock
+        now = time.monotonic()
+        self._expire_idle(shard, now)
+        session = self._cached(shard, user_id, now)
+        if session is not None:
+            shard.cache_hits += 1
+        else:
+            shard.cache_misses += 1
+        return session
+
+    def _load(self, user_id: str):
+        if not self.backend.persistent:
+            return None
+        return self.backend.load(user_id)
+
+    def _adopt(self, shard: _Shard, user_id: str, data, create: bool):
+        # Caller holds shard.lock. When the backend was read without the lock,
+        # another turn may have loaded or created the session meanwhile.
+        session = self._cached(shard, user_id, time.monotonic())
+        if session is not None:
+            return session
+        stale = shard.sessions.get(user_id)
+        if data is not None and stale is not None:
+            # Refreshed in place: a thread may already hold it between
+            # get_or_create and its change
+            stale.refresh(data)
+            stale.last_seen = time.monotonic()
+            shard.sessions.move_to_end(user_id)
+            return stale
+        if data is not None:
+            session = Session.from_dict(data, self.history_size, self.sentiment_size,
+                                        self.token_budget, self.summary_budget)
+        elif create:
+            session = self.new_session()
+            shard.created += 1
+        else:
+            shard.sessions.pop(user_id, None)
+            return None
+        self._insert(shard, user_id, session)
+        return session
+
+    def new_session(self) -> Session:
+        """
+        Returns an empty session with the store's limits that isn't stored
+        anywhere, e.g. for an anonymous turn that must not share history.
+        """
+        return Session(self.history_size, self.sentiment_size,
+                       self.token_budget, self.summary_budget)
+
+    def get(self, user_id: str):
+        """Returns the live session for user_id, or None."""
+        shard = self._shard(user_id)
+        with shard.lock:
+            session = self._lookup(shard, user_id)
+            if session is None:
+                session = self._adopt(shard, user_id, self._load(user_id), create=False)
+            return session
+
+    def get_or_create(self, user_id: str) -> Session:
+        shard = self._shard(user_id)
+        with shard.lock:
+            session = self._lookup(shard, user_id)
+            if session is None:
+                session = self._adopt(shard, user_id, self._load(user_id), create=True)
+            return session
+
+    async def aget_or_create(self, user_id: str) -> Session:
+        """
+        get_or_create for the event loop: on a cache miss the backend is
+        read in a worker thread, so other requests keep being served.
+        """
+        shard = self._shard(user_id)
+        with shard.lock:
+            session = self._lookup(shard, user_id)
+        if session is not None:
+            return session
+        data = await asyncio.to_thread(self._load, user_id) if self.backend.persistent else None
+        with shard.lock:
+            return self._adopt(shard, user_id, data, create=True)
+
+    def turn_lock(self, user_id: str) -> asyncio.Lock:
+        """
+        asyncio lock that serializes turns for one user in this process.
+        Hold it from reading the history until the reply is appended.
+        """
+        shard = self._shard(user_id)
+        with shard.lock:
+            lock = shard.turn_locks.get(user_id)
+            if lock is None:
+                lock = asyncio.Lock()
+                shard.turn_locks[user_id] = lock
+            return lock
+
+    def mark_dirty(self, user_id: str, session: Session):
+        """
+        Queues a changed session for the next write-behind batch. Sessions
+        without a user_id are throwaway and never written.
+        """
+        if user_id is None or not self.backend.persistent:
+            return
+        with self._pending_lock:
+            self._pending[user_id] = session
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="session-flusher", daemon=True)
+                self._flusher.start()
+
+    def flush(self):
+        """Writes every pending session to the backend in one batch."""
+        with self._flush_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+            # Each snapshot holds that session's lock, so no turn is half-applied
+            snapshots = {user_id: session.snapshot() for user_id, session in pending.items()}
+            if not snapshots:
+                return
+            try:
+                self.backend.save_many([(user_id, data) for user_id, (data, _) in snapshots.items()])
+            except Exception:
+                # Put the batch back for the next attempt; sessions queued meanwhile
+                # are the same live objects or newer, so they win
+                with self._pending_lock:
+                    for user_id, session in pending.items():
+                        self._pending.setdefault(user_id, session)
+                self.flush_errors += 1
+                raise
+            for user_id, (_, version) in snapshots.items():
+                session = pending[user_id]
+                session.saved_version = max(session.saved_version, version)
+            self.flushes += 1
+
+    def _flush_loop(self):
+        last_purge = time.monotonic()
+        while not self._stop.wait(self.flush_interval):
+            # An error (e.g. "database is locked") must not kill the thread:
+            # mark_dirty never restarts it, so nothing would be persisted again
+            try:
+                self.flush()
+                if time.monotonic() - last_purge > 60:
+                    last_purge = time.monotonic()
+                    self.backend.purge_idle(self.idle_ttl)
+            except Exception:
+                logger.exception("session flush failed; %d sessions will be retried", len(self._pending))
+
+    def close(self):
+        self._stop.set()
+        # Let the flusher finish its batch, so the final flush and closing the
+        # backend's connections don't race it
+        if self._flusher is not None:
+            self._flusher.join(timeout=max(5.0, self.flush_interval * 2))
+        try:
+            self.flush()
+        finally:
+            self.backend.close()
+
+    def __len__(self):
+        return sum(len(shard.sessions) for shard in self._shards)
+
+    def _total(self, counter: str) -> int:
+        return sum(getattr(shard, counter) for shard in self._shards)
+
+    def memory_footprint(self) -> dict:
+        sessions = []
+        total = 0
+        for shard in self._shards:
+            with shard.lock:
+                sessions.extend(shard.sessions.values())
+                total += sys.getsizeof(shard.sessions)
+        total += sum(s.footprint() for s in sessions)
+        return {
+            "sessions": len(sessions),
+            "bytes": total,
+            "avg_bytes_per_session": total // len(sessions) if sessions else 0,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "max_sessions": self.max_sessions,
+            "shards": len(self._shards),
+            "idle_ttl_seconds": self.idle_ttl,
+            "history_size": self.history_size,
+            "sentiment_size": self.sentiment_size,
+            "history_token_budget": self.token_budget,
+            "summary_token_budget": self.summary_budget,
+            "created": self._total("created"),
+            "expired": self._total("expired"),
+            "evicted": self._total("evicted"),
+            "cache_hits": self._total("cache_hits"),
+            "cache_misses": self._total("cache_misses"),
+            "pending_writes": len(self._pending),
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+            "backend": self.backend.stats(),
+            "memory": self.memory_footprint(),
+        }
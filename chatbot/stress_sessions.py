@@ -0,0 +1,166 @@
+"""
+Session Store Stress Test
+Hammers one shared session and many separate sessions from many threads
+(and from concurrent asyncio turns) and checks that every conversation
+history is intact: each reply directly follows its own question, and no
+message is lost or duplicated. Runs offline, no server or API key needed.
+
+Usage: python stress_sessions.py [--threads 32] [--turns 200] [--users 500] [--sqlite]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import threading
+import time
+
+from session_store import SessionStore
+from session_backends import SQLiteSessionBackend
+
+
+def make_store(use_sqlite: bool) -> SessionStore:
+    backend = None
+    if use_sqlite:
+        backend = SQLiteSessionBackend(os.path.join(tempfile.mkdtemp(), "stress_sessions.db"))
+    # History limits are lifted so every message stays in the ring buffers and can be checked
+    return SessionStore(max_sessions=100_000, history_size=1_000_000, token_budget=10**12,
+                        backend=backend, flush_interval=0.01)
+
+
+def check_history(session, expected_turns: int) -> list:
+    """Returns a list of problems found in one session's history."""
+    problems = []
+    messages = list(session.messages)
+    if len(messages) != expected_turns * 2:
+        problems.append(f"expected {expected_turns * 2} messages, found {len(messages)}")
+    seen = set()
+    for question, answer in zip(messages[::2], messages[1::2]):
+        if question.type != "human" or answer.type != "ai":
+            problems.append(f"out of order: {question.type} then {answer.type}")
+            continue
+        turn_id = question.content.split(":", 1)[1]
+        if answer.content != "answer:" + turn_id:
+            problems.append(f"reply {answer.content} does not match {question.content}")
+        if turn_id in seen:
+            problems.append(f"duplicate turn {turn_id}")
+        seen.add(turn_id)
+    return problems
+
+
+def hammer_threads(store: SessionStore, user_ids: list, threads: int, turns: int) -> float:
+    """Each thread appends `turns` exchanges, spread over `user_ids`."""
+    def worker(worker_id: int):
+        rng = random.Random(worker_id)
+        for i in range(turns):
+            user_id = rng.choice(user_ids)
+            session = store.get_or_create(user_id)
+            turn_id = f"{worker_id}-{i}"
+            session.add_exchange("question:" + turn_id, "answer:" + turn_id)
+            session.add_sentiment({"emotion": "neutral", "compound": 0.0})
+            store.mark_dirty(user_id, session)
+            # Readers run alongside the writers
+            session.render_history()
+            session.to_dict()
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - started
+
+
+async def hammer_turns(store: SessionStore, user_id: str, tasks: int) -> float:
+    """
+    Concurrent async turns for one user that read the history, yield
+    (like awaiting the LLM) and then append. Without the turn lock,
+    each turn would see a stale history.
+    """
+    stale = 0
+
+    async def turn(n: int):
+        nonlocal stale
+        async with store.turn_lock(user_id):
+            session = await store.aget_or_create(user_id)
+            before = len(session.messages)
+            await asyncio.sleep(random.random() / 1000)
+            if len(session.messages) != before:
+                stale += 1
+            session.add_exchange(f"question:async-{n}", f"answer:async-{n}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(turn(n) for n in range(tasks)))
+    elapsed = time.perf_counter() - started
+    if stale:
+        print(f"   ❌ {stale} turns saw their history change mid-turn")
+    return elapsed
+
+
+def report(name: str, problems: list, elapsed: float, exchanges: int) -> bool:
+    status = "✅ PASS" if not problems else "❌ FAIL"
+    print(f"{status} {name}: {exchanges} exchanges in {elapsed:.2f}s "
+          f"({exchanges / elapsed:,.0f}/s)")
+    for problem in problems[:10]:
+        print(f"   - {problem}")
+    return not problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--turns", type=int, default=200, help="exchanges per thread")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--sqlite", action="store_true", help="also write behind to a temporary SQLite file")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("SESSION STORE STRESS TEST".center(80))
+    print("=" * 80)
+    print(f"threads={args.threads} turns/thread={args.turns} users={args.users} "
+          f"backend={'sqlite' if args.sqlite else 'memory'}\n")
+
+    ok = True
+    exchanges = args.threads * args.turns
+
+    # 1) Every thread writes to the same session
+    store = make_store(args.sqlite)
+    elapsed = hammer_threads(store, ["shared-user"], args.threads, args.turns)
+    ok &= report("one session, many threads", check_history(store.get("shared-user"), exchanges),
+                 elapsed, exchanges)
+    store.close()
+
+    # 2) Threads spread over many sessions
+    store = make_store(args.sqlite)
+    user_ids = [f"user-{n}" for n in range(args.users)]
+    elapsed = hammer_threads(store, user_ids, args.threads, args.turns)
+    problems = []
+    total = 0
+    for user_id in user_ids:
+        session = store.get(user_id)
+        if session is None:
+            continue
+        turns = len(session.messages) // 2
+        total += turns
+        problems.extend(f"{user_id}: {p}" for p in check_history(session, turns))
+    if total != exchanges:
+        problems.append(f"expected {exchanges} exchanges across all sessions, found {total}")
+    ok &= report("many sessions, many threads", problems, elapsed, exchanges)
+    store.close()
+
+    # 3) Concurrent async turns for one user, serialized by the turn lock
+    store = make_store(args.sqlite)
+    tasks = args.threads * 10
+    elapsed = asyncio.run(hammer_turns(store, "async-user", tasks))
+    ok &= report("one user, concurrent async turns", check_history(store.get("async-user"), tasks),
+                 elapsed, tasks)
+    store.close()
+
+    print("\n" + ("✅ All session histories intact" if ok else "❌ Session history corruption detected"))
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
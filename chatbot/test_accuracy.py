@@ -1,10 +1,22 @@
 """
 Medical Chatbot Accuracy & Anti-Hallucination Testing Suite
 This script tests the chatbot's accuracy, fact-checking, and hallucination prevention
+
+Queries in each section run concurrently (--parallel), each test with its
+own user_id so conversations don't interfere. With --record, every response
+is saved to a cassette file; --replay answers from that file without a
+server or API key, so the keyword checks are deterministic and finish in
+seconds. Re-record after changing the prompt, model or server logic.
+
+Usage: python test_accuracy.py [--parallel 8] [--record | --replay] [--cassette accuracy_cassette.json]
 """
 
+import argparse
+import re
+import threading
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from colorama import init, Fore, Style
 import time
@@ -14,14 +26,46 @@ init(autoreset=True)
 
 API_URL = "http://localhost:8000/chat"
 
+class Cassette:
+    """Recorded chatbot responses, keyed by user, detail mode and query"""
+    def __init__(self, path, mode):
+        self.path = path
+        self.mode = mode  # "record" or "replay"
+        self.entries = {}
+        self.lock = threading.Lock()
+        if mode == "replay":
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def key(user_input, user_id, detail_mode):
+        return f"{user_id}|{detail_mode}|{user_input}"
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, response):
+        with self.lock:
+            self.entries[key] = response
+
+    def save(self):
+        if self.mode != "record":
+            return
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True, ensure_ascii=False)
+
 class ChatbotTester:
-    def __init__(self):
+    def __init__(self, parallel=8, cassette=None):
+        self.parallel = max(1, parallel)
+        self.cassette = cassette
+        self.started = time.perf_counter()
         self.results = {
             "total_tests": 0,
             "passed": 0,
             "failed": 0,
             "warnings": 0,
-            "test_details": []
+            "test_details": [],
+            "latencies": []
         }
     
     def print_header(self, text):
@@ -30,7 +74,7 @@ class ChatbotTester:
         print(f"{Fore.CYAN}{Style.BRIGHT}{text.center(80)}")
         print("="*80 + "\n")
     
-    def print_test(self, test_name, status, message=""):
+    def print_test(self, test_name, status, message="", latency_ms=None):
         """Print test result with color coding"""
         if status == "PASS":
             print(f"{Fore.GREEN}✓ {test_name}: {status}")
@@ -41,27 +85,51 @@ class ChatbotTester:
         
         if message:
             print(f"  {Fore.WHITE}→ {message}")
+        if latency_ms is not None:
+            print(f"  {Fore.WHITE}⏱ {latency_ms:.0f} ms")
+            self.results["latencies"].append({"test": test_name, "latency_ms": round(latency_ms, 1)})
         print()
     
-    def send_query(self, user_input, user_id="test_user"):
-        """Send query to chatbot API"""
+    def send_query(self, user_input, user_id="test_user", detail_mode="concise"):
+        """Send query to chatbot API (or the cassette); returns (response, latency in ms)"""
+        key = Cassette.key(user_input, user_id, detail_mode)
+        if self.cassette is not None and self.cassette.mode == "replay":
+            recorded = self.cassette.get(key)
+            if recorded is None:
+                return {"error": "not in cassette (re-record with --record)"}, 0.0
+            return recorded["response"], recorded["latency_ms"]
+
+        started = time.perf_counter()
         try:
             response = requests.post(
                 API_URL,
                 json={
                     "user_input": user_input,
                     "user_id": user_id,
-                    "detail_mode": "concise"
+                    "detail_mode": detail_mode
                 },
                 timeout=30
             )
+            latency_ms = (time.perf_counter() - started) * 1000
             
             if response.status_code == 200:
-                return response.json()
+                result = response.json()
+                if self.cassette is not None:
+                    self.cassette.put(key, {"response": result, "latency_ms": round(latency_ms, 1)})
+                return result, latency_ms
             else:
-                return {"error": f"HTTP {response.status_code}"}
+                return {"error": f"HTTP {response.status_code}"}, latency_ms
         except Exception as e:
-            return {"error": str(e)}
+            return {"error": str(e)}, (time.perf_counter() - started) * 1000
+    
+    def send_queries(self, tests):
+        """Send each test's query concurrently, as its own user; results come back in test order"""
+        def send(test):
+            user_id = "test_" + re.sub(r"[^a-z0-9]+", "_", test["name"].lower()).strip("_")
+            return self.send_query(test["query"], user_id)
+        
+        with ThreadPoolExecutor(max_workers=self.parallel) as pool:
+            return list(pool.map(send, tests))
     
     def test_medical_accuracy(self):
         """Test medical accuracy with known medical facts"""
@@ -94,13 +162,12 @@ class ChatbotTester:
             }
         ]
         
-        for test in tests:
+        for test, (response, latency_ms) in zip(tests, self.send_queries(tests)):
             self.results["total_tests"] += 1
-            response = self.send_query(test["query"])
             
             if "error" in response:
                 self.results["failed"] += 1
-                self.print_test(test["name"], "FAIL", f"API Error: {response['error']}")
+                self.print_test(test["name"], "FAIL", f"API Error: {response['error']}", latency_ms)
                 continue
             
             reply = response.get("reply", "").lower()
@@ -113,24 +180,25 @@ class ChatbotTester:
                 self.print_test(
                     test["name"], 
                     "PASS", 
-                    f"Found {found_keywords}/{len(test['expected_keywords'])} expected medical terms"
+                    f"Found {found_keywords}/{len(test['expected_keywords'])} expected medical terms",
+                    latency_ms
                 )
             else:
                 self.results["failed"] += 1
                 self.print_test(
                     test["name"], 
                     "FAIL", 
-                    f"Only found {found_keywords}/{test['min_keywords']} required medical terms"
+                    f"Only found {found_keywords}/{test['min_keywords']} required medical terms",
+                    latency_ms
                 )
             
             self.results["test_details"].append({
                 "test": test["name"],
                 "query": test["query"],
                 "response_length": len(reply),
-                "keywords_found": found_keywords
+                "keywords_found": found_keywords,
+                "latency_ms": round(latency_ms, 1)
             })
-            
-            time.sleep(0.5)  # Avoid rate limiting
     
     def test_hallucination_prevention(self):
         """Test anti-hallucination measures"""
@@ -163,13 +231,12 @@ class ChatbotTester:
             }
         ]
         
-        for test in tests:
+        for test, (response, latency_ms) in zip(tests, self.send_queries(tests)):
             self.results["total_tests"] += 1
-            response = self.send_query(test["query"])
             
             if "error" in response:
                 self.results["failed"] += 1
-                self.print_test(test["name"], "FAIL", f"API Error: {response['error']}")
+                self.print_test(test["name"], "FAIL", f"API Error: {response['error']}", latency_ms)
                 continue
             
             reply = response.get("reply", "").lower()
@@ -204,8 +271,7 @@ class ChatbotTester:
             else:
                 self.results["failed"] += 1
             
-            self.print_test(test["name"], status, message)
-            time.sleep(0.5)
+            self.print_test(test["name"], status, message, latency_ms)
     
     def test_sentiment_analysis(self):
         """Test sentiment analysis accuracy"""
@@ -239,13 +305,12 @@ class ChatbotTester:
             }
         ]
         
-        for test in tests:
+        for test, (response, latency_ms) in zip(tests, self.send_queries(tests)):
             self.results["total_tests"] += 1
-            response = self.send_query(test["query"])
             
             if "error" in response:
                 self.results["failed"] += 1
-                self.print_test(test["name"], "FAIL", f"API Error: {response['error']}")
+                self.print_test(test["name"], "FAIL", f"API Error: {response['error']}", latency_ms)
                 continue
             
             sentiment = response.get("sentiment", {})
@@ -256,17 +321,17 @@ class ChatbotTester:
                 self.print_test(
                     test["name"], 
                     "PASS", 
-                    f"Correctly detected '{detected_emotion}' emotion"
+                    f"Correctly detected '{detected_emotion}' emotion",
+                    latency_ms
                 )
             else:
                 self.results["failed"] += 1
                 self.print_test(
                     test["name"], 
                     "FAIL", 
-                    f"Expected '{test['expected_emotion']}' but got '{detected_emotion}'"
+                    f"Expected '{test['expected_emotion']}' but got '{detected_emotion}'",
+                    latency_ms
                 )
-            
-            time.sleep(0.5)
     
     def test_response_quality(self):
         """Test response quality metrics"""
@@ -293,13 +358,12 @@ class ChatbotTester:
             }
         ]
         
-        for test in tests:
+        for test, (response, latency_ms) in zip(tests, self.send_queries(tests)):
             self.results["total_tests"] += 1
-            response = self.send_query(test["query"])
             
             if "error" in response:
                 self.results["failed"] += 1
-                self.print_test(test["name"], "FAIL", f"API Error: {response['error']}")
+                self.print_test(test["name"], "FAIL", f"API Error: {response['error']}", latency_ms)
                 continue
             
             reply = response.get("reply", "")
@@ -310,17 +374,17 @@ class ChatbotTester:
                 self.print_test(
                     test["name"], 
                     "PASS", 
-                    f"Response length: {length} chars (within {test['min_length']}-{test['max_length']})"
+                    f"Response length: {length} chars (within {test['min_length']}-{test['max_length']})",
+                    latency_ms
                 )
             else:
                 self.results["warnings"] += 1
                 self.print_test(
                     test["name"], 
                     "WARNING", 
-                    f"Response length: {length} chars (expected {test['min_length']}-{test['max_length']})"
+                    f"Response length: {length} chars (expected {test['min_length']}-{test['max_length']})",
+                    latency_ms
                 )
-            
-            time.sleep(0.5)
     
     def test_temperature_consistency(self):
         """Test low temperature (0.3) for consistent responses"""
@@ -330,14 +394,22 @@ class ChatbotTester:
         
         print(f"{Fore.CYAN}Testing consistency by asking same question twice...\n")
         
-        response1 = self.send_query(query, "user_test_1")
-        time.sleep(1)
-        response2 = self.send_query(query, "user_test_2")
+        # Each user opens with a different message, so the two prompts differ and the
+        # second answer can't come from the response cache or a coalesced LLM call
+        def ask(user_id, opener):
+            self.send_query(opener, user_id)
+            return self.send_query(query, user_id)
+        
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            first = pool.submit(ask, "user_test_1", "Hi, I have a question about my health.")
+            second = pool.submit(ask, "user_test_2", "Hello, I'd like some medical information.")
+            (response1, latency1), (response2, latency2) = first.result(), second.result()
+        latency_ms = max(latency1, latency2)
         
         if "error" in response1 or "error" in response2:
             self.results["total_tests"] += 1
             self.results["failed"] += 1
-            self.print_test("Temperature Consistency", "FAIL", "API Error")
+            self.print_test("Temperature Consistency", "FAIL", "API Error", latency_ms)
             return
         
         reply1 = response1.get("reply", "")
@@ -357,14 +429,16 @@ class ChatbotTester:
             self.print_test(
                 "Temperature Consistency", 
                 "PASS", 
-                f"Responses are {similarity:.1f}% similar (indicates low temperature is working)"
+                f"Responses are {similarity:.1f}% similar (indicates low temperature is working)",
+                latency_ms
             )
         else:
             self.results["warnings"] += 1
             self.print_test(
                 "Temperature Consistency", 
                 "WARNING", 
-                f"Responses are only {similarity:.1f}% similar"
+                f"Responses are only {similarity:.1f}% similar",
+                latency_ms
             )
     
     def generate_report(self):
@@ -379,6 +453,23 @@ class ChatbotTester:
         print(f"{Fore.YELLOW}Warnings: {Style.BRIGHT}{self.results['warnings']}")
         print(f"\n{Fore.CYAN}Pass Rate: {Style.BRIGHT}{pass_rate:.1f}%\n")
         
+        # Timing: wall clock for the whole run vs. the time spent waiting on each query
+        wall_clock = time.perf_counter() - self.started
+        latencies = sorted(entry["latency_ms"] for entry in self.results["latencies"])
+        timing = {
+            "wall_clock_seconds": round(wall_clock, 2),
+            "parallel": self.parallel,
+            "mode": self.cassette.mode if self.cassette is not None else "live",
+            "total_query_seconds": round(sum(latencies) / 1000, 2),
+            "p50_latency_ms": latencies[len(latencies) // 2] if latencies else 0,
+            "max_latency_ms": latencies[-1] if latencies else 0
+        }
+        print(f"{Fore.CYAN}Wall Clock: {Style.BRIGHT}{timing['wall_clock_seconds']}s "
+              f"{Style.NORMAL}({timing['mode']}, parallel={self.parallel}, "
+              f"{timing['total_query_seconds']}s of query time)")
+        print(f"{Fore.CYAN}Per-Test Latency: {Style.BRIGHT}p50 {timing['p50_latency_ms']:.0f} ms, "
+              f"max {timing['max_latency_ms']:.0f} ms\n")
+        
         # Overall assessment
         if pass_rate >= 90:
             print(f"{Fore.GREEN}{Style.BRIGHT}🎉 EXCELLENT: Chatbot shows high accuracy and strong anti-hallucination measures!")
@@ -397,7 +488,8 @@ class ChatbotTester:
             json.dump({
                 "timestamp": datetime.now().isoformat(),
                 "results": self.results,
-                "pass_rate": pass_rate
+                "pass_rate": pass_rate,
+                "timing": timing
             }, f, indent=2)
         
         print(f"\n{Fore.CYAN}📄 Detailed report saved to: {Style.BRIGHT}{report_file}")
@@ -405,6 +497,14 @@ class ChatbotTester:
 
 def main():
     """Main test execution"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--parallel", type=int, default=8, help="queries in flight at once")
+    cassette_mode = parser.add_mutually_exclusive_group()
+    cassette_mode.add_argument("--record", action="store_true", help="save responses to the cassette")
+    cassette_mode.add_argument("--replay", action="store_true", help="answer from the cassette, offline")
+    parser.add_argument("--cassette", default="accuracy_cassette.json")
+    args = parser.parse_args()
+    
     print(f"\n{Fore.MAGENTA}{Style.BRIGHT}")
     print("╔════════════════════════════════════════════════════════════════════════════╗")
     print("║           MEDICAL CHATBOT ACCURACY & ANTI-HALLUCINATION TEST               ║")
@@ -412,16 +512,20 @@ def main():
     print("╚════════════════════════════════════════════════════════════════════════════╝")
     print(Style.RESET_ALL)
     
-    tester = ChatbotTester()
+    cassette = None
+    if args.record or args.replay:
+        cassette = Cassette(args.cassette, "record" if args.record else "replay")
+    tester = ChatbotTester(parallel=args.parallel, cassette=cassette)
     
     print(f"{Fore.YELLOW}⚙️  Testing Configuration:")
     print(f"   • API Endpoint: {API_URL}")
+    if cassette is not None:
+        print(f"   • Cassette: {args.cassette} ({cassette.mode})")
+    print(f"   • Parallel Queries: {tester.parallel}")
     print(f"   • Model: Google Gemini 2.5 Flash")
     print(f"   • Temperature: 0.3 (Low - for factual responses)")
     print(f"   • Starting tests...\n")
     
-    time.sleep(2)
-    
     try:
         # Run all test suites
         tester.test_medical_accuracy()
@@ -438,6 +542,9 @@ def main():
         tester.generate_report()
     except Exception as e:
         print(f"\n\n{Fore.RED}❌ Error during testing: {str(e)}")
+    finally:
+        if cassette is not None:
+            cassette.save()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,13 @@
+"""
+Cheap token estimates for prompt budgeting.
+Gemini doesn't expose a local tokenizer, so we use the usual ~4 characters
+per token rule of thumb; it's only used for budgets and reporting.
+"""
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
@@ -0,0 +1,116 @@
+"""
+Token usage and cost accounting for LLM calls.
+Keeps global and per-model totals plus the heaviest users in bounded
+memory, to spot conversations whose growing history makes every turn
+more expensive.
+"""
+import threading
+
+
+def usage_from_metadata(usage_metadata) -> dict:
+    """Normalizes a LangChain usage_metadata dict; None if it's missing."""
+    if not usage_metadata:
+        return None
+    input_tokens = int(usage_metadata.get("input_tokens") or 0)
+    output_tokens = int(usage_metadata.get("output_tokens") or 0)
+    total_tokens = int(usage_metadata.get("total_tokens") or input_tokens + output_tokens)
+    # Thinking tokens are billed as output and already included in output_tokens
+    reasoning_tokens = int((usage_metadata.get("output_token_details") or {}).get("reasoning") or 0)
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": total_tokens,
+            "reasoning_tokens": reasoning_tokens}
+
+
+class UsageTracker:
+    """
+    Aggregates token usage globally, per model and per user.
+
+    Per-user totals use the Space-Saving heavy-hitter algorithm: at most
+    `max_users` users are tracked, and a new user replaces the one with the
+    smallest total, inheriting that total as its possible overcount
+    (`error`). Anyone whose true usage exceeds total/max_users is
+    guaranteed to be tracked, so the top of the list is reliable while
+    memory stays fixed.
+
+    Cost is computed from per-million-token prices; 0 disables it.
+    """
+
+    def __init__(self, max_users: int = 1000, input_price_per_million: float = 0.0,
+                 output_price_per_million: float = 0.0):
+        self.max_users = max_users
+        self.input_price = input_price_per_million
+        self.output_price = output_price_per_million
+        self._lock = threading.Lock()
+        self._users = {}
+        self._models = {}
+        self.totals = self._empty()
+        self.estimated_calls = 0
+        self.users_replaced = 0
+
+    @staticmethod
+    def _empty() -> dict:
+        return {"llm_calls": 0, "input_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+
+    @staticmethod
+    def _add(bucket: dict, usage: dict):
+        bucket["llm_calls"] += 1
+        bucket["input_tokens"] += usage["input_tokens"]
+        bucket["output_tokens"] += usage["output_tokens"]
+        bucket["total_tokens"] += usage["total_tokens"]
+
+    def cost(self, usage: dict) -> float:
+        return round((usage["input_tokens"] * self.input_price
+                      + usage["output_tokens"] * self.output_price) / 1_000_000, 6)
+
+    def record(self, user_id: str, model: str, usage: dict, estimated: bool = False):
+        user_id = user_id or "anonymous"
+        with self._lock:
+            self._add(self.totals, usage)
+            if estimated:
+                self.estimated_calls += 1
+            self._add(self._models.setdefault(model, self._empty()), usage)
+
+            entry = self._users.get(user_id)
+            if entry is None:
+                error = 0
+                if len(self._users) >= self.max_users:
+                    smallest = min(self._users, key=lambda u: self._users[u]["total_tokens"])
+                    error = self._users.pop(smallest)["total_tokens"]
+                    self.users_replaced += 1
+                entry = self._empty()
+                entry["total_tokens"] = error
+                entry["error"] = error
+                entry["last_input_tokens"] = 0
+                self._users[user_id] = entry
+            self._add(entry, usage)
+            entry["last_input_tokens"] = usage["input_tokens"]
+
+    def heavy_users(self, top: int = 20) -> list:
+        with self._lock:
+            ranked = sorted(self._users.items(), key=lambda item: item[1]["total_tokens"], reverse=True)[:top]
+            users = []
+            for user_id, entry in ranked:
+                calls = entry["llm_calls"]
+                users.append({
+                    "user_id": user_id,
+                    **entry,
+                    # Input tokens per call grow with the conversation history
+                    "avg_input_tokens": round(entry["input_tokens"] / calls, 1) if calls else 0.0,
+                    "cost_usd": self.cost(entry),
+                })
+            return users
+
+    def stats(self, top: int = 20) -> dict:
+        with self._lock:
+            totals = dict(self.totals)
+            models = {model: {**bucket, "cost_usd": self.cost(bucket)} for model, bucket in self._models.items()}
+            tracked = len(self._users)
+        return {
+            "totals": {**totals, "cost_usd": self.cost(totals)},
+            "estimated_calls": self.estimated_calls,
+            "models": models,
+            "prices_per_million_tokens": {"input": self.input_price, "output": self.output_price},
+            "users_tracked": tracked,
+            "max_users": self.max_users,
+            "users_replaced": self.users_replaced,
+            "heavy_users": self.heavy_users(top),
+        }